@@ -0,0 +1,386 @@
+"""Background acquisition engine for the uroflowmetry device.
+
+The engine owns the device socket on a dedicated thread so the Tk event
+loop never blocks on network I/O. Decoded samples and status changes are
+pushed onto a thread-safe ``queue.Queue`` as ``(kind, payload)`` tuples,
+which the UI drains with ``root.after`` polling.
+"""
+import socket
+import threading
+import time
+
+import instrumentation
+from calibration import Calibration
+from decode import StreamDecoder, decode_frame, timestamp_flows
+from filters import make_filter
+from protocol import TYPE_END, FrameDecoder
+from streamreader import FrameReader
+from textdecode import TextDecoder, decode_text, looks_like_text
+
+# Device defaults (Pico W firmware listening on the local network)
+DEVICE_HOST = '192.168.1.3'
+DEVICE_PORT = 4244
+CMD_START = b'\x30\x30'    # single-shot: send the whole batch at the end
+CMD_STREAM = b'\x30\x31'   # streaming: push samples as they are measured
+CMD_STREAM_FRAMED = b'\x30\x32'   # streaming using protocol.py frames
+
+MODE_BATCH = 'batch'
+MODE_STREAM = 'stream'
+
+# Message kinds pushed onto the output queue
+MSG_STATUS = 'status'      # payload: human readable status text
+MSG_PROGRESS = 'progress'  # payload: (bytes_received, frame_size)
+MSG_SAMPLES = 'samples'    # payload: (times, flows) float64 NumPy arrays
+MSG_CHUNK = 'chunk'        # payload: (times, flows) to append (stream mode)
+MSG_ERROR = 'error'        # payload: error message
+MSG_DONE = 'done'          # payload: True if cancelled, False otherwise
+
+
+class AcquisitionEngine:
+    """Run one device test on a background thread.
+
+    ``mode`` selects a single-shot batch (``MODE_BATCH``, the whole test is
+    sent at the end) or a streaming session (``MODE_STREAM``, samples are
+    emitted as ``MSG_CHUNK`` messages while the test is running). Passing a
+    ``replay.SessionReplay`` runs the same pipeline over a recorded session.
+
+    Usage::
+
+        engine = AcquisitionEngine(out_queue)
+        engine.start()
+        ...
+        engine.cancel()   # optional, stops the test mid-stream
+    """
+
+    def __init__(self, out_queue, host=DEVICE_HOST, port=DEVICE_PORT,
+                 sample_interval=0.3, flowrate_min=0.0, flowrate_max=50.0,
+                 graph_total_duration=120.0, timeout=300.0, poll_interval=0.5,
+                 on_payload=None, mode=MODE_BATCH, chunk_size=4096, framed=False,
+                 replay=None, replay_speed=1.0, raw_filter=None, text=None, calibration=None):
+        self.out_queue = out_queue
+        self.mode = mode
+        # stream mode only: device speaks the framed protocol (protocol.py)
+        self.framed = framed
+        # replay.SessionReplay to feed instead of the device socket; the
+        # recorded mode/framing/sample interval override the arguments
+        self.replay = replay
+        self.replay_speed = replay_speed
+        if replay is not None:
+            mode, framed = replay.mode, replay.framed
+            self.mode, self.framed = mode, framed
+            sample_interval = replay.sample_interval
+        self.host = host
+        self.port = port
+        self.sample_interval = sample_interval
+        self.flowrate_min = flowrate_min
+        self.flowrate_max = flowrate_max
+        self.graph_total_duration = graph_total_duration
+        # smoothing for calibrated readings before differentiation: a filters.py
+        # spec such as 'median:5' (a fresh filter is built for every run)
+        self.raw_filter = raw_filter
+        # calibration.Calibration of the load cell (default: linear 1.2 raw
+        # per mL); `tare()` re-zeroes it while a stream is running
+        self.calibration = calibration if calibration is not None else Calibration.linear()
+        # device sends text flow values (JSON / NDJSON / CSV, see
+        # textdecode.py) instead of uint16 readings; None = detect from the
+        # first payload
+        self.text = text
+        # one batch = graph_total_duration / sample_interval uint16 samples
+        # (400 x 2 bytes = 800 bytes for the default 120 s test)
+        self.frame_samples = max(1, int(round(graph_total_duration / sample_interval)))
+        self.frame_size = self.frame_samples * 2
+        # receive buffer size for stream mode (reused for every recv_into)
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        # recv() wakes up at least this often to check for cancellation
+        self.poll_interval = poll_interval
+        # optional hook called with every raw payload on the worker thread
+        # (used for TCP debug logging so it never runs on the Tk thread)
+        self.on_payload = on_payload
+        # perf_counter() stamp of the latest payload (set while
+        # instrumentation is enabled; feeds the receive -> plot latency)
+        self.received_at = None
+        self._decoder = None
+        # set when the test ended with MSG_ERROR
+        self.failed = False
+        self._cancel = threading.Event()
+        self._sock = None
+        self._sock_lock = threading.Lock()
+        self._thread = None
+
+    # ------------------------------------------------------------------
+    # public control API (called from the Tk thread)
+    # ------------------------------------------------------------------
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._cancel.clear()
+        self.failed = False
+        self._thread = threading.Thread(target=self._run, name='uro-acquisition', daemon=True)
+        self._thread.start()
+
+    def cancel(self):
+        """Request the running test to stop. Safe to call from any thread."""
+        self._cancel.set()
+        with self._sock_lock:
+            s = self._sock
+        if s is not None:
+            # unblock a pending connect()/recv() immediately
+            try:
+                s.shutdown(socket.SHUT_RDWR)
+            except Exception:
+                pass
+
+    def run(self):
+        """Run the test synchronously in the calling thread.
+
+        Used for headless replay; messages still go to ``out_queue``.
+        """
+        self._cancel.clear()
+        self.failed = False
+        self._run()
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def tare(self):
+        """Zero the scale at the latest reading of the running stream.
+
+        Safe to call from any thread; the acquisition thread switches to
+        the new calibration table on its next chunk. Returns the raw reading
+        used, or None if no reading has arrived yet.
+        """
+        decoder = self._decoder
+        raw = decoder.prev_raw if decoder is not None else None
+        if raw is not None:
+            self.calibration.set_tare(raw)
+        return raw
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def join(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    # ------------------------------------------------------------------
+    # worker thread
+    # ------------------------------------------------------------------
+    def _emit(self, kind, payload=None):
+        self.out_queue.put((kind, payload))
+
+    def _run(self):
+        try:
+            if self.mode == MODE_STREAM:
+                self._run_stream()
+            else:
+                self._run_batch()
+        except Exception as e:
+            if not self._cancel.is_set():
+                instrumentation.count('connect_errors')
+                self.failed = True
+                self._emit(MSG_ERROR, str(e))
+        finally:
+            with self._sock_lock:
+                self._sock = None
+            self._emit(MSG_DONE, self._cancel.is_set())
+
+    def _log_payload(self, data):
+        if instrumentation.enabled:
+            self.received_at = time.perf_counter()
+            instrumentation.count('payloads')
+            instrumentation.count('bytes', len(data))
+        if self.on_payload is not None:
+            try:
+                self.on_payload(bytes(data))
+            except Exception:
+                # fallback to simple print if helper fails
+                print(f"Received data (raw): {bytes(data)}")
+
+    def _run_batch(self):
+        if self.replay is not None:
+            self._emit(MSG_STATUS, 'Device: Replaying session')
+            # pace like the original test: wait until the last payload arrived
+            for _ in self.replay.chunks(self.replay_speed, self._cancel.is_set):
+                pass
+            data = self.replay.payload()
+        else:
+            data = self._fetch()
+        if self._cancel.is_set():
+            return
+        if data:
+            self._log_payload(data)
+            samples = self._decode_payload(data)
+            if samples is not None and len(samples[0]):
+                instrumentation.count('samples', len(samples[0]))
+                instrumentation.since('decode', self.received_at)
+                self._emit(MSG_SAMPLES, samples)
+
+    def _open(self, s, command):
+        """Connect ``s`` to the device and send ``command``."""
+        with self._sock_lock:
+            self._sock = s
+        if self._cancel.is_set():
+            return False
+        self._emit(MSG_STATUS, 'Device: Connecting...')
+        s.settimeout(self.timeout)
+        s.connect((self.host, self.port))
+        instrumentation.count('connects')
+        try:
+            s.send(command)
+            print(f"[TCP CMD] Sent command: {' '.join(f'0x{b:02x}' for b in command)}")
+        except Exception as e:
+            print(f"[TCP CMD] Failed to send command: {e}")
+        self._emit(MSG_STATUS, 'Device: Test running')
+        # Read in short timeout slices so cancel() is honoured even if the
+        # socket shutdown does not wake up recv().
+        s.settimeout(self.poll_interval)
+        return not self._cancel.is_set()
+
+    def _fetch(self):
+        """Connect, send the start command and read one complete batch.
+
+        Returns a memoryview of the frame (valid until the next read) or
+        ``b''`` if cancelled, timed out or the device sent nothing.
+        """
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+            # Send command: 2 bytes 0x30 0x30
+            if not self._open(s, CMD_START):
+                return b''
+            reader = FrameReader(s, self.frame_size)
+            frame = reader.read_frame(should_stop=self._cancel.is_set,
+                                      timeout=self.timeout,
+                                      on_progress=self._on_progress)
+            if frame is None or self._cancel.is_set():
+                return b''
+            if len(frame) < self.frame_size:
+                self._emit(MSG_STATUS, f'Device: Incomplete batch ({len(frame)}/{self.frame_size} bytes)')
+            return frame
+
+    def _run_stream(self):
+        """Streaming session: decode and emit each chunk as it arrives.
+
+        The device pushes samples as they are measured, either as raw uint16
+        values or (``framed=True``) as protocol frames. The test ends after
+        ``frame_samples`` samples, an end-of-test frame, when the device
+        closes the connection, or after ``timeout`` seconds without data.
+        """
+        if self.replay is not None:
+            self._emit(MSG_STATUS, 'Device: Replaying session')
+            self._consume_stream(self.replay.chunks(self.replay_speed, self._cancel.is_set))
+            return
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+            if not self._open(s, CMD_STREAM_FRAMED if self.framed else CMD_STREAM):
+                return
+            self._consume_stream(self._socket_chunks(s))
+
+    def _socket_chunks(self, s):
+        """Yield views of each ``recv_into`` into one reused buffer."""
+        buf = bytearray(self.chunk_size)
+        view = memoryview(buf)
+        idle = 0.0
+        while not self._cancel.is_set():
+            try:
+                n = s.recv_into(view)
+            except socket.timeout:
+                idle += self.poll_interval
+                if idle >= self.timeout:
+                    self._emit(MSG_STATUS, 'Device: Stream timed out')
+                    return
+                continue
+            except OSError:
+                if self._cancel.is_set():
+                    return
+                raise
+            if n == 0:
+                return
+            idle = 0.0
+            yield view[:n]
+
+    def _consume_stream(self, chunks):
+        """Run the stream decode pipeline over an iterable of byte chunks."""
+        decoder = StreamDecoder(self.sample_interval, self.flowrate_min, self.flowrate_max,
+                                raw_filter=make_filter(self.raw_filter),
+                                calibration=self.calibration)
+        self._decoder = decoder
+        frames = FrameDecoder() if self.framed else None
+        text = None   # TextDecoder if the first chunk is text
+        detect = frames is None
+        ended = False
+        for chunk in chunks:
+            if self._cancel.is_set():
+                return
+            self._log_payload(chunk)
+            if detect:
+                detect = False
+                text = TextDecoder() if self._is_text(chunk) else None
+            if text is not None:
+                self._emit_chunk(decoder, decoder.feed_flows(text.feed(chunk)))
+            elif frames is None:
+                self._emit_chunk(decoder, decoder.feed(chunk))
+            else:
+                for frame in frames.feed(chunk):
+                    if frame.type == TYPE_END:
+                        ended = True
+                        break
+                    self._apply_frame(decoder, frames, frame)
+            if ended or decoder.count >= self.frame_samples:
+                break
+        else:
+            if text is not None:
+                # the device closed the connection: flush a last unterminated row
+                self._emit_chunk(decoder, decoder.feed_flows(text.finish()))
+        if text is not None and text.errors:
+            print(f"[TCP PARSE] {text.values} text values, {text.errors} malformed messages")
+        if frames is not None:
+            instrumentation.count('frames', frames.frames)
+            instrumentation.count('frames_dropped', frames.dropped)
+            instrumentation.count('frames_reordered', frames.reordered)
+            instrumentation.count('crc_errors', frames.crc_errors)
+        if frames is not None and (frames.dropped or frames.reordered or frames.crc_errors):
+            print(f"[TCP FRAME] {frames.frames} frames, {frames.dropped} dropped, "
+                  f"{frames.reordered} reordered, {frames.crc_errors} CRC errors")
+        if not ended and decoder.count < self.frame_samples and not self._cancel.is_set():
+            self._emit(MSG_STATUS, f'Device: Stream ended early ({decoder.count}/{self.frame_samples} samples)')
+
+    def _apply_frame(self, decoder, frames, frame):
+        """Place a protocol frame on the time axis and emit its samples."""
+        if frames.dropped != decoder.dropped:
+            self._emit(MSG_STATUS, f'Device: {frames.dropped} frame(s) lost')
+        self._emit_chunk(decoder, decoder.feed_frame(frame, frames.dropped))
+
+    def _emit_chunk(self, decoder, chunk):
+        times, flows = chunk
+        if len(times):
+            instrumentation.count('samples', len(times))
+            instrumentation.since('decode', self.received_at)
+            self._emit(MSG_CHUNK, (times, flows))
+            self._emit(MSG_PROGRESS, (min(decoder.count, self.frame_samples) * 2, self.frame_size))
+
+    def _on_progress(self, filled, frame_size):
+        self._emit(MSG_PROGRESS, (filled, frame_size))
+
+    def _decode_payload(self, data):
+        """Turn a device payload into ``(times, flows)`` arrays (or None)."""
+        max_samples = max(1, int(self.graph_total_duration / self.sample_interval))
+        if self._is_text(data):
+            flows = decode_text(data)
+            print(f"[TCP PARSE] Parsed {len(flows)} text flow samples")
+            if not len(flows):
+                return None
+            return timestamp_flows(flows, float(self.sample_interval),
+                                   self.flowrate_min, self.flowrate_max,
+                                   max_samples=max_samples)
+        if len(data) < 2:
+            return None
+        times, flows = decode_frame(data, float(self.sample_interval),
+                                    self.flowrate_min, self.flowrate_max,
+                                    max_samples=max_samples,
+                                    raw_filter=make_filter(self.raw_filter),
+                                    calibration=self.calibration)
+        print(f"[TCP PARSE] Parsed {len(data) // 2} 16-bit samples -> computed {len(flows)} flow samples (example: {flows[:10]}...) ")
+        return times, flows
+
+    def _is_text(self, data):
+        return self.text if self.text is not None else looks_like_text(data)
@@ -0,0 +1,95 @@
+"""Headless batch PDF generation over recorded sessions.
+
+Decodes each recorded session (see replay.py) through the acquisition
+pipeline and renders its report in a process pool. Nothing here imports
+tkinter, so it runs on a server or from cron::
+
+    python batch_report.py ~/uro_sessions -o reports/ -j 4
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+from replay import decode_session
+from reporting import build_report
+
+
+def find_sessions(paths):
+    """Expand files, directories (all ``*.cap``) and glob patterns."""
+    found = []
+    for p in paths:
+        p = os.path.expanduser(p)
+        if os.path.isdir(p):
+            found.extend(sorted(glob.glob(os.path.join(p, '*.cap'))))
+        elif any(ch in p for ch in '*?['):
+            found.extend(sorted(glob.glob(p)))
+        else:
+            found.append(p)
+    return found
+
+
+def render_session(path, out_dir, graph_total_duration=120.0, flowrate_min=0.0, flowrate_max=50.0,
+                   raw_filter=None):
+    """Worker: decode one session and write ``<out_dir>/<name>.pdf``.
+
+    ``raw_filter=None`` decodes with the filter the session was recorded
+    with; ``''`` turns filtering off.
+    """
+    decode_args = {} if raw_filter is None else {'raw_filter': raw_filter}
+    times, flows, meta = decode_session(path, graph_total_duration=graph_total_duration,
+                                        flowrate_min=flowrate_min, flowrate_max=flowrate_max,
+                                        **decode_args)
+    if not len(times):
+        raise ValueError('session contains no samples')
+    name = os.path.splitext(os.path.basename(path))[0] + '.pdf'
+    out_path = os.path.join(out_dir, name)
+    recorded = datetime.fromtimestamp(meta['started']) if 'started' in meta else None
+    build_report(out_path, times, flows, graph_total_duration=graph_total_duration,
+                 flowrate_min=flowrate_min, flowrate_max=flowrate_max, recorded=recorded)
+    return out_path
+
+
+def generate_reports(paths, out_dir, workers=None, **plot_args):
+    """Render reports for ``paths`` in parallel; returns ``(done, failed)`` lists."""
+    os.makedirs(out_dir, exist_ok=True)
+    done, failed = [], []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(render_session, p, out_dir, **plot_args): p for p in paths}
+        for fut in as_completed(futures):
+            try:
+                done.append(fut.result())
+            except Exception as e:
+                failed.append((futures[fut], str(e)))
+    return done, failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Render PDF reports for recorded sessions')
+    parser.add_argument('sessions', nargs='+', help='.cap files, directories or glob patterns')
+    parser.add_argument('-o', '--out-dir', default='reports')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='worker processes (default: CPUs)')
+    parser.add_argument('--duration', type=float, default=120.0, help='x-axis length in seconds')
+    parser.add_argument('--filter', help="raw reading filter, e.g. 'median:5' (see filters.py); "
+                                         "default: as recorded, 'none' to disable")
+    args = parser.parse_args(argv)
+
+    paths = find_sessions(args.sessions)
+    if not paths:
+        print('No sessions found')
+        return 1
+    start = time.perf_counter()
+    done, failed = generate_reports(paths, args.out_dir, args.jobs, graph_total_duration=args.duration,
+                                    raw_filter='' if args.filter == 'none' else args.filter)
+    elapsed = time.perf_counter() - start
+    for path, err in failed:
+        print(f'FAILED {path}: {err}')
+    print(f'{len(done)} reports in {elapsed:.1f} s ({len(failed)} failed) -> {args.out_dir}')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,74 @@
+"""Micro-benchmark: legacy per-sample decode loop vs. the NumPy decode stage.
+
+Run from anywhere::
+
+    python server/py/bench/bench_decode.py [--repeat N] [--sizes 400,10000,100000]
+"""
+import argparse
+import os
+import struct
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+
+from decode import decode_frame  # noqa: E402
+
+SAMPLE_INTERVAL = 0.3
+FLOWRATE_MIN = 0.0
+FLOWRATE_MAX = 50.0
+
+
+def legacy_decode(data, dt=SAMPLE_INTERVAL, flowrate_min=FLOWRATE_MIN, flowrate_max=FLOWRATE_MAX):
+    """The struct.unpack + Python loop path formerly in connect_device."""
+    num_samples = len(data) // 2
+    raw_vals = list(struct.unpack(f'<{num_samples}H', data[:num_samples * 2]))
+    raw_per_ml = 1.2
+    flows = [0.0]
+    for i in range(1, len(raw_vals)):
+        diff_raw = float(raw_vals[i]) - float(raw_vals[i - 1])
+        flow = diff_raw / raw_per_ml / dt if dt > 0 else 0.0
+        if flow < 0:
+            flow = 0.0
+        flows.append(float(flow))
+    clamped = []
+    for v in flows:
+        fv = float(v)
+        fv = max(flowrate_min, min(flowrate_max, fv))
+        clamped.append(fv)
+    return [((i + 1) * dt, float(clamped[i])) for i in range(len(clamped))]
+
+
+def synthetic_payload(n, seed=0):
+    """Cumulative load-cell curve with a little sensor noise, as uint16 bytes."""
+    rng = np.random.default_rng(seed)
+    t = np.linspace(0.0, 1.0, n)
+    raw = 1200.0 * (1.0 - np.cos(np.pi * t)) / 2.0 + rng.normal(0.0, 2.0, n)
+    return np.clip(raw, 0, 65535).astype('<u2').tobytes()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--sizes', default='400,10000,100000')
+    args = parser.parse_args(argv)
+
+    print(f"{'samples':>10} {'legacy ms':>12} {'numpy ms':>12} {'speedup':>9}")
+    for n in (int(x) for x in args.sizes.split(',')):
+        data = synthetic_payload(n)
+        # sanity check: both paths agree
+        t, f = decode_frame(data, SAMPLE_INTERVAL, FLOWRATE_MIN, FLOWRATE_MAX)
+        ref = legacy_decode(data)
+        assert np.allclose(f, [s[1] for s in ref]) and np.allclose(t, [s[0] for s in ref])
+
+        number = max(1, 20000 // n)
+        legacy = min(timeit.repeat(lambda: legacy_decode(data), number=number, repeat=args.repeat)) / number
+        vec = min(timeit.repeat(lambda: decode_frame(data, SAMPLE_INTERVAL, FLOWRATE_MIN, FLOWRATE_MAX),
+                                number=number, repeat=args.repeat)) / number
+        print(f"{n:>10} {legacy * 1e3:>12.3f} {vec * 1e3:>12.3f} {legacy / vec:>8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+"""Stage-by-stage and end-to-end timings of the acquisition-to-report path.
+
+For every payload size (synthetic uint16 load-cell batches) the hot paths
+are timed separately and chained together:
+
+    socket_read   FrameReader.read_frame over a local socket pair
+    capture       CaptureWriter.write (``_debug_log_tcp``) for the payload
+    decode        uint16 decode + calibration table lookup + flow differentiation
+    filter        flow derivation with the app's default raw filter (filters.py)
+    clamp         clamping and timestamping
+    metrics       FlowMetrics update
+    plot          LivePlot.update (``plot_live_samples``) on an Agg canvas
+    report        build_report (``_generate_pdf_from_live``) into memory
+    end_to_end    one chained pass as the app runs it: socket read, capture,
+                  filtered decode, clamp, metrics, plot and report
+
+``filter`` re-derives the flow that ``decode`` already derived unfiltered,
+so the stages do not add up to ``end_to_end``; it is timed on its own pass.
+
+Results (best-of-``--repeat`` milliseconds) are written as JSON and can be
+compared against a stored baseline; a stage slower than
+``baseline * (1 + tolerance)`` fails the run (``STAGE_TOLERANCE`` widens
+the tolerance of noisy stages)::
+
+    python server/py/bench/bench_pipeline.py --out results.json
+    python server/py/bench/bench_pipeline.py --baseline server/py/bench/baseline.json
+    python server/py/bench/bench_pipeline.py --save-baseline server/py/bench/baseline.json
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+
+from calibration import Calibration  # noqa: E402
+from decode import decode_raw, flow_from_volume, timestamp_flows  # noqa: E402
+from filters import make_filter  # noqa: E402
+from liveplot import LivePlot  # noqa: E402
+from metrics import FlowMetrics  # noqa: E402
+from reporting import build_report  # noqa: E402
+from simulator import synthetic_curve  # noqa: E402
+from streamreader import FrameReader  # noqa: E402
+from tcpcapture import CAPTURE_FULL, CaptureWriter  # noqa: E402
+
+SAMPLE_INTERVAL = 0.3
+FLOWRATE_MIN = 0.0
+FLOWRATE_MAX = 50.0
+RAW_FILTER = 'median:5'
+CHUNK = 4096  # acquisition receive size; capture sees payloads of this size
+
+STAGES = ('socket_read', 'capture', 'decode', 'filter', 'clamp', 'metrics', 'plot', 'report',
+          'end_to_end')
+DEFAULT_SIZES = '400,10000,100000'
+DEFAULT_TOLERANCE = 0.5
+# stages whose best-of-N still varies more than that between runs on one
+# machine: decode @ 100k allocates ~1.6 MB of fresh arrays right after the
+# report stage, and the first-touch page faults alone swing it 0.45-0.9 ms
+STAGE_TOLERANCE = {'decode': 1.0}
+MIN_REGRESSION_MS = 0.25  # ignore differences within scheduling noise
+
+
+def _socket_read(payload):
+    """Send ``payload`` over a socket pair and read it as one frame."""
+    rx, tx = socket.socketpair()
+    try:
+        sender = threading.Thread(target=tx.sendall, args=(payload,), daemon=True)
+        reader = FrameReader(rx, len(payload))
+        start = time.perf_counter()
+        sender.start()
+        frame = reader.read_frame()
+        elapsed = time.perf_counter() - start
+        sender.join()
+        return elapsed, bytes(frame)
+    finally:
+        rx.close()
+        tx.close()
+
+
+def _capture(capture, payload):
+    view = memoryview(payload)
+    for i in range(0, len(view), CHUNK):
+        capture.write(view[i:i + CHUNK])
+
+
+def _decode(data, calibration):
+    volume = calibration.convert(decode_raw(data))
+    return volume, flow_from_volume(volume, SAMPLE_INTERVAL)
+
+
+def _pipeline(data, capture, calibration, plot, n):
+    """Capture, decode (filtered), clamp, measure, plot and report ``data``."""
+    _capture(capture, data)
+    volume = make_filter(RAW_FILTER).process(calibration.convert(decode_raw(data)))
+    times, flows = timestamp_flows(flow_from_volume(volume, SAMPLE_INTERVAL), SAMPLE_INTERVAL,
+                                   FLOWRATE_MIN, FLOWRATE_MAX)
+    metrics = FlowMetrics()
+    metrics.update(times, flows)
+    plot.update(times, flows)
+    build_report(io.BytesIO(), times, flows, n * SAMPLE_INTERVAL, FLOWRATE_MIN, FLOWRATE_MAX,
+                 None, metrics.snapshot())
+
+
+def _timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+def run_size(n, repeat, plot, capture_dir):
+    """Best-of-``repeat`` milliseconds per stage for an ``n``-sample payload."""
+    payload = synthetic_curve(n, seed=0).tobytes()
+    best = dict.fromkeys(STAGES, float('inf'))
+    calibration = Calibration.linear()
+    capture = CaptureWriter(os.path.join(capture_dir, f'bench_{n}.cap'), level=CAPTURE_FULL,
+                            queue_size=0)
+    plot.set_limits(xlim=(0.0, n * SAMPLE_INTERVAL))
+    for _ in range(repeat):
+        t = {}
+        t['socket_read'], data = _socket_read(payload)
+        t['capture'], _ = _timed(_capture, capture, data)
+        t['decode'], (volume, flows) = _timed(_decode, data, calibration)
+        t['filter'], _ = _timed(lambda v: flow_from_volume(make_filter(RAW_FILTER).process(v),
+                                                           SAMPLE_INTERVAL), volume)
+        t['clamp'], (times, flows) = _timed(timestamp_flows, flows, SAMPLE_INTERVAL,
+                                            FLOWRATE_MIN, FLOWRATE_MAX)
+        t['metrics'], _ = _timed(lambda: FlowMetrics().update(times, flows))
+        # steady state: the plot already shows data, so this is a blit
+        t['plot'], _ = _timed(plot.update, times, flows)
+        metrics = FlowMetrics()
+        metrics.update(times, flows)
+        t['report'], _ = _timed(build_report, io.BytesIO(), times, flows,
+                                n * SAMPLE_INTERVAL, FLOWRATE_MIN, FLOWRATE_MAX, None,
+                                metrics.snapshot())
+        read, data = _socket_read(payload)
+        t['end_to_end'] = read + _timed(_pipeline, data, capture, calibration, plot, n)[0]
+        for stage, seconds in t.items():
+            best[stage] = min(best[stage], seconds * 1e3)
+    capture.close()
+    return best
+
+
+def compare(results, baseline, tolerance):
+    """Return ``[(size, stage, ms, baseline_ms)]`` for regressed stages.
+
+    Stages in ``STAGE_TOLERANCE`` use the larger of their own and ``tolerance``.
+    """
+    regressions = []
+    for size, stages in results.items():
+        for stage, ms in stages.items():
+            ref = baseline.get(size, {}).get(stage)
+            if ref is None:
+                continue
+            allowed = max(tolerance, STAGE_TOLERANCE.get(stage, 0.0))
+            if ms > ref * (1.0 + allowed) and ms - ref > MIN_REGRESSION_MS:
+                regressions.append((size, stage, ms, ref))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help='comma-separated sample counts')
+    parser.add_argument('--repeat', type=int, default=7)
+    parser.add_argument('--out', help='write results as JSON here')
+    parser.add_argument('--baseline', help='JSON results to compare against')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='allowed slowdown vs. the baseline (0.5 = 50%%)')
+    parser.add_argument('--save-baseline', help='write results as the new baseline')
+    args = parser.parse_args(argv)
+
+    plot = LivePlot(master=None, ylim=(FLOWRATE_MIN, FLOWRATE_MAX))
+    plot.update([0.0, SAMPLE_INTERVAL], [0.0, 0.0])
+    results = {}
+    with tempfile.TemporaryDirectory() as capture_dir:
+        for n in (int(x) for x in args.sizes.split(',')):
+            results[str(n)] = run_size(n, args.repeat, plot, capture_dir)
+
+    print(f"{'samples':>8} " + ' '.join(f'{s:>11}' for s in STAGES))
+    for size, stages in results.items():
+        print(f"{size:>8} " + ' '.join(f'{stages[s]:>11.3f}' for s in STAGES))
+
+    doc = {
+        'meta': {
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'platform': platform.platform(),
+            'repeat': args.repeat,
+            'unit': 'ms',
+        },
+        'results': results,
+    }
+    for path in (args.out, args.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(doc, f, indent=2)
+
+    if not args.baseline:
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)['results']
+    regressions = compare(results, baseline, args.tolerance)
+    for size, stage, ms, ref in regressions:
+        print(f"REGRESSION {stage} @ {size} samples: {ms:.3f} ms vs baseline {ref:.3f} ms")
+    if regressions:
+        return 1
+    print(f"OK: no stage more than {args.tolerance:.0%} slower than {args.baseline}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
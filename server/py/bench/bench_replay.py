@@ -0,0 +1,92 @@
+"""End-to-end replay throughput: capture file -> engine -> ring buffer -> plot.
+
+Replays a recorded session (or a synthetic one) through AcquisitionEngine
+and measures how fast the decode/flow/plot pipeline consumes it::
+
+    python server/py/bench/bench_replay.py [SESSION.cap] [--speed 0] [--repeat 3]
+"""
+import argparse
+import os
+import queue
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from acquisition import (AcquisitionEngine, MODE_STREAM, MSG_CHUNK,  # noqa: E402
+                         MSG_DONE, MSG_SAMPLES)
+from liveplot import LivePlot  # noqa: E402
+from protocol import TYPE_END, encode_frame  # noqa: E402
+from replay import SessionRecorder, SessionReplay, SPEED_MAX  # noqa: E402
+from ringbuffer import SampleRing  # noqa: E402
+from simulator import synthetic_curve  # noqa: E402
+
+
+def make_synthetic_session(path, n_samples, frame_samples=4, sample_interval=0.3):
+    """Record a framed streaming session of ``n_samples`` samples."""
+    rec = SessionRecorder(path, mode=MODE_STREAM, framed=True, sample_interval=sample_interval)
+    samples = synthetic_curve(n_samples, seed=0)
+    seq = 0
+    for i in range(0, n_samples, frame_samples):
+        rec.write(encode_frame(seq, samples[i:i + frame_samples], int(i * sample_interval * 1000)))
+        seq += 1
+    rec.write(encode_frame(seq, (), 0, TYPE_END))
+    rec.close()
+
+
+def replay_once(path, speed, plot):
+    replay = SessionReplay(path)
+    n = 0
+    q = queue.Queue()
+    duration = replay.sample_interval * 10 ** 7  # never trim: capacity comes from the ring
+    engine = AcquisitionEngine(q, replay=replay, replay_speed=speed,
+                               graph_total_duration=duration)
+    ring = SampleRing(1 << 20)
+    frames = 0
+    start = time.perf_counter()
+    engine.start()
+    while True:
+        kind, payload = q.get()
+        if kind in (MSG_SAMPLES, MSG_CHUNK):
+            ring.extend(*payload)
+            n += len(payload[0])
+        elif kind == MSG_DONE:
+            break
+        # redraw at most once per drained burst, like the UI scheduler
+        if q.empty() and plot is not None and len(ring):
+            plot.update(*ring.view(), ring.generation)
+            frames += 1
+    elapsed = time.perf_counter() - start
+    nbytes = replay.total_bytes
+    replay.close()
+    return elapsed, n, nbytes, frames
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('session', nargs='?', help='recorded .cap file (default: synthetic)')
+    parser.add_argument('--samples', type=int, default=100000, help='synthetic session length')
+    parser.add_argument('--speed', type=float, default=SPEED_MAX, help='0 = max speed')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--no-plot', action='store_true')
+    args = parser.parse_args(argv)
+
+    path = args.session
+    tmpdir = None
+    if path is None:
+        tmpdir = tempfile.TemporaryDirectory()
+        path = os.path.join(tmpdir.name, 'synthetic.cap')
+        make_synthetic_session(path, args.samples)
+
+    plot = None if args.no_plot else LivePlot(master=None, xlim=(0.0, args.samples * 0.3))
+    for i in range(args.repeat):
+        elapsed, n, nbytes, frames = replay_once(path, args.speed, plot)
+        print(f"run {i + 1}: {n} samples, {nbytes} bytes in {elapsed * 1e3:.1f} ms "
+              f"({n / elapsed:,.0f} samples/s, {nbytes / elapsed / 1e6:.1f} MB/s, {frames} redraws)")
+    if tmpdir is not None:
+        tmpdir.cleanup()
+
+
+if __name__ == '__main__':
+    main()
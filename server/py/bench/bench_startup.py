@@ -0,0 +1,86 @@
+"""Cold-start import budget for the kiosk app.
+
+Runs ``python -X importtime -c "import uro2"`` in a fresh interpreter (best
+of ``--repeat`` runs), reports the total module-load time and the heaviest
+top-level imports, and exits non-zero when the budget is exceeded or a
+module listed in ``--forbid`` is imported at startup::
+
+    python server/py/bench/bench_startup.py [--budget-ms 150] [--forbid numpy,matplotlib,reportlab]
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_BUDGET_MS = 150.0
+DEFAULT_FORBID = 'numpy,matplotlib,reportlab'
+
+
+def import_times(module='uro2', python=sys.executable):
+    """Import ``module`` in a new interpreter.
+
+    Returns ``[(name, self_us, cumulative_us, depth)]`` in the order
+    ``-X importtime`` reports them (children before their parent).
+    """
+    proc = subprocess.run([python, '-X', 'importtime', '-c', f'import {module}'],
+                          cwd=APP_DIR, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f'importing {module} failed:\n{proc.stderr}')
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+
+def summarize(rows, module='uro2', top=8):
+    """``(total_ms, heaviest top-level imports, set of imported names)``."""
+    total_us = sum(self_us for _, self_us, _, _ in rows)
+    # depth 0/1: modules imported by interpreter startup or directly by `module`
+    roots = sorted((r for r in rows if r[3] <= 1 and r[0] != module), key=lambda r: -r[2])
+    return total_us / 1e3, roots[:top], {r[0] for r in rows}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--module', default='uro2')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--budget-ms', type=float, default=DEFAULT_BUDGET_MS,
+                        help='fail if importing the app takes longer (0 = no budget)')
+    parser.add_argument('--forbid', default=DEFAULT_FORBID,
+                        help='comma-separated top-level packages that must not load at startup')
+    args = parser.parse_args(argv)
+
+    best = None
+    for _ in range(max(1, args.repeat)):
+        result = summarize(import_times(args.module), args.module)
+        if best is None or result[0] < best[0]:
+            best = result
+    total_ms, heaviest, names = best
+
+    print(f"import {args.module}: {total_ms:.1f} ms (best of {args.repeat})")
+    print(f"{'module':<32} {'cumulative ms':>14}")
+    for name, _, cumulative_us, _ in heaviest:
+        print(f"{name:<32} {cumulative_us / 1e3:>14.1f}")
+
+    failed = False
+    forbidden = [m for m in args.forbid.split(',') if m]
+    loaded = sorted(m for m in forbidden if m in names)
+    if loaded:
+        print(f"FAIL: imported at startup: {', '.join(loaded)}")
+        failed = True
+    if args.budget_ms and total_ms > args.budget_ms:
+        print(f"FAIL: {total_ms:.1f} ms exceeds the {args.budget_ms:.0f} ms startup budget")
+        failed = True
+    if not failed:
+        print(f"OK: within the {args.budget_ms:.0f} ms budget")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,192 @@
+"""Per-device load-cell calibration compiled into a lookup table.
+
+A calibration maps net HX711 counts (reading minus the tare reading) to mL,
+either piecewise-linearly through measured ``(counts, mL)`` points or with
+a polynomial. The curve is evaluated once for every possible uint16 reading
+into a 65536-entry float64 table. Converting a chunk of readings is then a
+single ``np.take``, whatever the shape of the curve.
+
+Tare and recalibration build a new table on the calling thread and swap it
+in with one attribute assignment (``Calibration.compiled``). The acquisition
+thread reads that attribute once per chunk, so it never waits on a lock and
+never sees a half-built table.
+
+Calibrations are kept per device host (the same device id the collector
+and the session store use) in a JSON file::
+
+    python calibration.py set 192.168.1.3 --points 0:0,600:480,1200:1000
+    python calibration.py set 192.168.1.3 --poly 0,0.8333,1e-6 --tare 37
+    python calibration.py list
+"""
+import argparse
+import functools
+import json
+import os
+import threading
+
+import numpy as np
+
+RAW_LEVELS = 1 << 16
+# Default device mapping: raw 0 -> 0 mL, raw 1200 -> 1000 mL (linear)
+RAW_ZERO = 0
+RAW_PER_ML = 1.2  # raw units per mL
+
+CALIBRATION_PATH = '~/uro_calibration.json'
+
+_RAW = np.arange(RAW_LEVELS, dtype=np.float64)
+
+
+def _piecewise(net, points):
+    """Piecewise-linear through ``points``, extended linearly past both ends."""
+    xp, fp = points[:, 0], points[:, 1]
+    out = np.interp(net, xp, fp)
+    if len(xp) > 1:
+        lo = net < xp[0]
+        out[lo] = fp[0] + (net[lo] - xp[0]) * (fp[1] - fp[0]) / (xp[1] - xp[0])
+        hi = net > xp[-1]
+        out[hi] = fp[-1] + (net[hi] - xp[-1]) * (fp[-1] - fp[-2]) / (xp[-1] - xp[-2])
+    return out
+
+
+@functools.lru_cache(maxsize=8)
+def linear_table(raw_per_ml=RAW_PER_ML, raw_zero=RAW_ZERO):
+    """Shared read-only table for the default linear mapping."""
+    table = (_RAW - raw_zero) / raw_per_ml
+    table.flags.writeable = False
+    return table
+
+
+class Calibration:
+    """uint16 reading -> mL mapping for one load cell.
+
+    Give either ``points`` (``[(net_counts, ml), ...]``, piecewise-linear)
+    or ``coeffs`` (polynomial in net counts, lowest order first). ``tare``
+    is the raw reading of the empty scale.
+    """
+
+    def __init__(self, points=None, coeffs=None, tare=RAW_ZERO):
+        self.version = 0
+        self.compiled = None   # (version, table); replaced, never modified
+        self._lock = threading.Lock()
+        self.tare = int(tare)
+        self.recalibrate(points, coeffs)
+
+    @classmethod
+    def linear(cls, raw_per_ml=RAW_PER_ML, raw_zero=RAW_ZERO):
+        return cls(coeffs=(0.0, 1.0 / raw_per_ml), tare=raw_zero)
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(points=d.get('points'), coeffs=d.get('coeffs'), tare=d.get('tare', RAW_ZERO))
+
+    def to_dict(self):
+        d = {'tare': self.tare}
+        if self.points is not None:
+            d['points'] = self.points.tolist()
+        else:
+            d['coeffs'] = self.coeffs.tolist()
+        return d
+
+    def curve(self, net):
+        """mL for net counts ``net`` (array-like), evaluated from the model."""
+        net = np.asarray(net, dtype=np.float64)
+        if self.points is not None:
+            return _piecewise(net, self.points)
+        return np.polynomial.polynomial.polyval(net, self.coeffs)
+
+    def recalibrate(self, points=None, coeffs=None):
+        """Replace the curve and swap in its table."""
+        if (points is None) == (coeffs is None):
+            raise ValueError('give either points or coeffs')
+        if points is not None:
+            points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+            points = points[np.argsort(points[:, 0])]
+            if len(points) < 2 or np.any(np.diff(points[:, 0]) == 0):
+                raise ValueError('need at least two points with distinct counts')
+        self.points = points
+        self.coeffs = None if coeffs is None else np.asarray(coeffs, dtype=np.float64)
+        self._compile()
+
+    def set_tare(self, raw):
+        """Zero the scale at reading ``raw`` (e.g. the current reading)."""
+        self.tare = int(np.clip(round(float(raw)), 0, RAW_LEVELS - 1))
+        self._compile()
+
+    def _compile(self):
+        table = self.curve(_RAW - self.tare)
+        table.flags.writeable = False
+        with self._lock:
+            self.version += 1
+            self.compiled = (self.version, table)
+
+    @property
+    def table(self):
+        return self.compiled[1]
+
+    def convert(self, raw):
+        """mL for uint16 readings ``raw`` (one table lookup per reading)."""
+        return np.take(self.compiled[1], raw, mode='clip')
+
+
+class CalibrationStore:
+    """Calibrations by device id, kept in a JSON file."""
+
+    def __init__(self, path=CALIBRATION_PATH):
+        self.path = os.path.expanduser(path)
+        self._data = {}
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self._data = json.load(f)
+
+    def devices(self):
+        return sorted(self._data)
+
+    def get(self, device):
+        """Calibration for ``device`` (its host), else the default.
+
+        A fresh object is returned, so taring it does not touch the store.
+        """
+        d = self._data.get(device)
+        return Calibration.from_dict(d) if d is not None else Calibration.linear()
+
+    def put(self, device, calibration):
+        self._data[device] = calibration.to_dict()
+        self.save()
+
+    def save(self):
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self._data, f, indent=2)
+        os.replace(tmp, self.path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Manage per-device load-cell calibrations')
+    parser.add_argument('--file', default=CALIBRATION_PATH)
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    sub.add_parser('list', help='show the stored calibrations')
+    put = sub.add_parser('set', help='store a calibration for a device')
+    put.add_argument('device', help='device host (IP address)')
+    curve = put.add_mutually_exclusive_group(required=True)
+    curve.add_argument('--points', help="piecewise-linear 'counts:mL,counts:mL,...' (net counts)")
+    curve.add_argument('--poly', help="polynomial coefficients 'c0,c1,...' (mL per net counts^i)")
+    put.add_argument('--tare', type=int, default=RAW_ZERO, help='raw reading of the empty scale')
+    args = parser.parse_args(argv)
+
+    store = CalibrationStore(args.file)
+    if args.cmd == 'list':
+        for device in store.devices():
+            print(f"{device:<22} {json.dumps(store.get(device).to_dict())}")
+        return 0
+    if args.points:
+        cal = Calibration(points=[tuple(float(v) for v in p.split(':'))
+                                  for p in args.points.split(',')], tare=args.tare)
+    else:
+        cal = Calibration(coeffs=[float(c) for c in args.poly.split(',')], tare=args.tare)
+    store.put(args.device, cal)
+    print(f"{args.device}: {json.dumps(cal.to_dict())}")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
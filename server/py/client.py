@@ -10,8 +10,8 @@ def tcp_client():
         s.connect((host, port))
         
         # Send data
-        //message = 'Hello, Server!'
-        //s.sendall(message.encode())
+        # message = 'Hello, Server!'
+        # s.sendall(message.encode())
         
         # Receive response
         data = s.recv(1024)
@@ -0,0 +1,161 @@
+"""Shape-preserving decimation of flow curves for plotting.
+
+A line plot cannot show more than a few points per pixel column, so long or
+high-rate sessions are reduced to the first, minimum, maximum and last
+sample of every column ("M4" min/max decimation) before they reach
+matplotlib. The drawn line is then pixel-identical to the full curve, and
+the peak (Qmax) is always kept because it is the maximum of its column.
+Render cost depends on the plot width, not on the session length.
+
+``decimate`` is the one-shot form (report figure). ``Decimator`` keeps the
+per-column aggregates of each zoom level (x range + width) and, when the
+samples only grew since the last call (the live plot case), re-aggregates
+just the last partial column and the new samples.
+"""
+from collections import OrderedDict
+
+import numpy as np
+
+# Levels (x range, width) kept by a Decimator; least recently used go first.
+MAX_LEVELS = 8
+
+
+def _columns_of(xs, x0, x1, columns):
+    """Pixel column of every sample; samples outside the range go to the edge columns."""
+    scale = columns / (x1 - x0) if x1 > x0 else 0.0
+    cols = np.floor((xs - x0) * scale)
+    np.clip(cols, 0, columns - 1, out=cols)
+    return cols.astype(np.intp)
+
+
+def _aggregate(ys, cols):
+    """Per-column ``(col, first, last, argmin, argmax)`` indices for sorted ``cols``."""
+    starts = np.flatnonzero(np.diff(cols, prepend=-1))
+    lengths = np.diff(starts, append=len(cols))
+    segs = np.arange(len(starts))
+    seg = np.repeat(segs, lengths)
+    out = [cols[starts], starts, starts + lengths - 1]
+    for reduce in (np.minimum, np.maximum):
+        extreme = reduce.reduceat(ys, starts)
+        hits = np.flatnonzero(ys == extreme[seg])
+        # first hit of every segment (NaN segments fall back to their start)
+        pick = np.searchsorted(seg[hits], segs)
+        found = pick < len(hits)
+        idx = starts.copy()
+        ok = found.copy()
+        ok[found] = seg[hits[pick[found]]] == segs[found]
+        idx[ok] = hits[pick[ok]]
+        out.append(idx)
+    return out
+
+
+def _select(first, last, imin, imax):
+    idx = np.concatenate((first, last, imin, imax))
+    return np.unique(idx[idx >= 0])
+
+
+def decimate(xs, ys, x0, x1, columns):
+    """Return ``(xs, ys)`` reduced to at most 4 samples per pixel column.
+
+    ``xs`` must be increasing. Inputs with no more than ``4 * columns``
+    samples are returned unchanged.
+    """
+    xs = np.asarray(xs, dtype=np.float64)
+    ys = np.asarray(ys, dtype=np.float64)
+    columns = int(columns)
+    if columns <= 0 or len(xs) <= 4 * columns:
+        return xs, ys
+    _, first, last, imin, imax = _aggregate(ys, _columns_of(xs, x0, x1, columns))
+    idx = _select(first, last, imin, imax)
+    return xs[idx], ys[idx]
+
+
+class _Level:
+    """Column aggregates of one zoom level, as sample indices (-1 = empty)."""
+
+    def __init__(self, x0, x1, columns):
+        self.x0, self.x1, self.columns = x0, x1, columns
+        self.first = np.full(columns, -1, dtype=np.intp)
+        self.last = np.full(columns, -1, dtype=np.intp)
+        self.imin = np.full(columns, -1, dtype=np.intp)
+        self.imax = np.full(columns, -1, dtype=np.intp)
+        self.n = 0           # samples aggregated so far
+        self.tail = -1       # column of the newest sample
+        self.selected = None
+
+    def extend(self, xs, ys):
+        # redo the newest (possibly partial) column together with the new samples
+        start = self.first[self.tail] if self.tail >= 0 else 0
+        cols, first, last, imin, imax = _aggregate(
+            ys[start:], _columns_of(xs[start:], self.x0, self.x1, self.columns))
+        for arr, idx in ((self.first, first), (self.last, last),
+                         (self.imin, imin), (self.imax, imax)):
+            arr[cols] = idx + start
+        self.n = len(xs)
+        self.tail = int(cols[-1])
+        self.selected = None
+
+    def indices(self):
+        if self.selected is None:
+            self.selected = _select(self.first, self.last, self.imin, self.imax)
+        return self.selected
+
+
+class Decimator:
+    """Incremental, per-zoom-level cache around `decimate`.
+
+    Call ``update`` with the full sample arrays on every refresh. If they
+    are the previous arrays plus newly appended samples, only the new tail
+    is aggregated; anything else (cleared, wrapped ring buffer) rebuilds.
+    Appends are recognised by the first and last samples seen; a new
+    session may repeat them, so pass the sample source's ``generation``
+    (e.g. `ringbuffer.SampleRing.generation`) or call ``clear``.
+    """
+
+    def __init__(self, max_levels=MAX_LEVELS):
+        self.max_levels = max_levels
+        self._levels = OrderedDict()
+        self._n = 0
+        self._ends = None    # (first time, last time, last flow) of the samples seen
+        self._generation = None
+
+    def clear(self):
+        self._levels.clear()
+        self._n = 0
+        self._ends = None
+
+    def update(self, xs, ys, x0, x1, columns, generation=None):
+        """Decimated ``(xs, ys)`` for the x range ``x0..x1`` drawn ``columns`` pixels wide.
+
+        A ``generation`` different from the previous call's drops the cache.
+        """
+        if generation != self._generation:
+            self.clear()
+            self._generation = generation
+        xs = np.asarray(xs, dtype=np.float64)
+        ys = np.asarray(ys, dtype=np.float64)
+        n = len(xs)
+        columns = int(columns)
+        if columns <= 0 or n <= 4 * columns:
+            # nothing to decimate; a new session starts from here
+            self.clear()
+            return xs, ys
+        m = self._n
+        appended = (self._ends is not None and n >= m
+                    and (xs[0], xs[m - 1], ys[m - 1]) == self._ends)
+        if not appended:
+            self._levels.clear()
+        self._n = n
+        self._ends = (xs[0], xs[-1], ys[-1])
+
+        key = (float(x0), float(x1), columns)
+        level = self._levels.pop(key, None)
+        if level is None:
+            level = _Level(*key)
+        self._levels[key] = level
+        while len(self._levels) > self.max_levels:
+            self._levels.popitem(last=False)
+        if level.n != n:
+            level.extend(xs, ys)
+        idx = level.indices()
+        return xs[idx], ys[idx]
@@ -0,0 +1,124 @@
+"""Stateful smoothing filters for load-cell readings.
+
+Flow is the difference of consecutive readings, which amplifies HX711
+noise; these filters run on the calibrated cumulative volumes (see
+calibration.py) before differentiation. Each filter is causal and keeps
+the tail of the previous chunk, so a stream filtered chunk by chunk gives
+exactly the same output as the whole recording filtered at once.
+``process`` is vectorized (one sliding-window pass per chunk) and returns
+float64 values.
+
+Filters are usually built from a short spec string, e.g. ``'median:5'``,
+``'mean:4'``, ``'savgol:9:2'`` or a chain ``'median:5+mean:3'``.
+"""
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+class WindowFilter:
+    """Base class: a causal filter over the last ``window`` readings.
+
+    Before the first reading the history is padded with that reading, so
+    the output starts at the signal level instead of ramping up from 0.
+    """
+
+    def __init__(self, window):
+        if window < 1:
+            raise ValueError('window must be >= 1')
+        self.window = int(window)
+        self.reset()
+
+    def reset(self):
+        self._history = None
+
+    def process(self, raw):
+        """Filter a chunk of readings; returns a float64 array of the same length."""
+        x = np.asarray(raw, dtype=np.float64)
+        if not len(x) or self.window == 1:
+            return x.copy()
+        if self._history is None:
+            self._history = np.full(self.window - 1, x[0])
+        padded = np.concatenate((self._history, x))
+        self._history = padded[-(self.window - 1):].copy()
+        return self._apply(sliding_window_view(padded, self.window))
+
+    def _apply(self, windows):
+        raise NotImplementedError
+
+
+class MovingAverage(WindowFilter):
+    """Mean of the last ``window`` readings."""
+
+    def _apply(self, windows):
+        return windows.mean(axis=1)
+
+
+class MedianFilter(WindowFilter):
+    """Median of the last ``window`` readings (removes isolated spikes)."""
+
+    def _apply(self, windows):
+        return np.median(windows, axis=1)
+
+
+class SavitzkyGolay(WindowFilter):
+    """Least-squares polynomial fit over the last ``window`` readings.
+
+    The fitted polynomial is evaluated at the newest reading (causal
+    Savitzky-Golay), which keeps steps and peaks sharper than a moving
+    average of the same length.
+    """
+
+    def __init__(self, window, polyorder=2):
+        if not 0 <= polyorder < window:
+            raise ValueError('polyorder must be less than window')
+        self.polyorder = int(polyorder)
+        # x = -(window-1) .. 0; row 0 of the pseudo-inverse gives the value at x = 0
+        x = np.arange(-(window - 1), 1, dtype=np.float64)
+        self._coeffs = np.linalg.pinv(np.vander(x, polyorder + 1, increasing=True))[0]
+        super().__init__(window)
+
+    def _apply(self, windows):
+        return windows @ self._coeffs
+
+
+class FilterChain:
+    """Apply several filters in sequence."""
+
+    def __init__(self, *filters):
+        self.filters = list(filters)
+
+    def reset(self):
+        for f in self.filters:
+            f.reset()
+
+    def process(self, raw):
+        x = np.asarray(raw, dtype=np.float64)
+        for f in self.filters:
+            x = f.process(x)
+        return x
+
+
+FILTERS = {
+    'mean': MovingAverage,
+    'median': MedianFilter,
+    'savgol': SavitzkyGolay,
+}
+
+
+def make_filter(spec):
+    """Build a filter from ``spec`` (see module docstring).
+
+    ``None`` or ``''`` means no filtering and returns None; filter objects
+    are passed through unchanged.
+    """
+    if not spec:
+        return None
+    if not isinstance(spec, str):
+        return spec
+    filters = []
+    for part in spec.split('+'):
+        name, *args = part.strip().split(':')
+        if name not in FILTERS:
+            raise ValueError(f'unknown filter {name!r} (expected one of {", ".join(FILTERS)})')
+        filters.append(FILTERS[name](*(int(a) for a in args)))
+    return filters[0] if len(filters) == 1 else FilterChain(*filters)
@@ -0,0 +1,200 @@
+"""Process-wide counters and latency histograms.
+
+Instrumentation is off by default. While disabled, ``count`` and
+``observe`` return after a single flag check, so the hooks can stay in the
+hot paths. Turn it on with ``enable()``. ``MetricsServer`` then serves the
+values in Prometheus text format::
+
+    curl http://127.0.0.1:9464/metrics
+
+Counters (``uro_<name>_total``):
+
+    bytes, payloads          raw device data received
+    frames, frames_dropped, frames_reordered, crc_errors   protocol.py frames
+    samples                  decoded flow samples
+    capture_dropped          payloads the TCP capture had to drop
+    connects, connect_errors, reconnects                   device connections
+    sessions, sessions_rejected                            collector (server.py)
+
+Histograms (``uro_<name>_seconds``):
+
+    decode          payload received -> samples decoded
+    plot            payload received -> samples drawn on screen
+    draw            duration of one plot redraw
+    report_build    report submitted -> PDF written
+    report_print    print job started -> sent to the printer
+"""
+import threading
+import time
+
+METRICS_PORT = 9464
+# histogram bucket upper bounds in seconds (the last bucket is +Inf)
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+enabled = False
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+
+
+class Histogram:
+    """Fixed-bucket latency histogram."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        i = 0
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                break
+        else:
+            i = len(self.buckets)
+        self.counts[i] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding quantile ``q`` (0..1)."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return self.buckets[i] if i < len(self.buckets) else self.max
+        return self.max
+
+
+def enable():
+    global enabled
+    enabled = True
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+
+def count(name, n=1):
+    """Add ``n`` to counter ``name``."""
+    if not enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+
+def observe(name, seconds):
+    """Record one latency sample (seconds) in histogram ``name``."""
+    if not enabled:
+        return
+    with _lock:
+        hist = _histograms.get(name)
+        if hist is None:
+            hist = _histograms[name] = Histogram()
+        hist.observe(seconds)
+
+
+def since(name, start):
+    """``observe(name, now - start)`` for a ``time.perf_counter()`` stamp."""
+    if enabled and start is not None:
+        observe(name, time.perf_counter() - start)
+
+
+def snapshot():
+    """``(counters, histograms)`` copies: ``{name: int}``, ``{name: Histogram}``."""
+    with _lock:
+        hists = {}
+        for name, h in _histograms.items():
+            c = Histogram(h.buckets)
+            c.counts, c.count, c.sum, c.max = list(h.counts), h.count, h.sum, h.max
+            hists[name] = c
+        return dict(_counters), hists
+
+
+def render_text():
+    """All metrics in Prometheus text exposition format."""
+    counters, hists = snapshot()
+    lines = []
+    for name in sorted(counters):
+        lines.append(f'# TYPE uro_{name}_total counter')
+        lines.append(f'uro_{name}_total {counters[name]}')
+    for name in sorted(hists):
+        h = hists[name]
+        metric = f'uro_{name}_seconds'
+        lines.append(f'# TYPE {metric} histogram')
+        cumulative = 0
+        for bound, n in zip(h.buckets, h.counts):
+            cumulative += n
+            lines.append(f'{metric}_bucket{{le="{bound:g}"}} {cumulative}')
+        lines.append(f'{metric}_bucket{{le="+Inf"}} {h.count}')
+        lines.append(f'{metric}_sum {h.sum:.6f}')
+        lines.append(f'{metric}_count {h.count}')
+    return '\n'.join(lines) + '\n'
+
+
+def summary_line():
+    """One-line digest for the on-screen overlay."""
+    counters, hists = snapshot()
+    parts = [f"rx {counters.get('bytes', 0) / 1024:.1f} kB",
+             f"samples {counters.get('samples', 0)}",
+             f"drops {counters.get('frames_dropped', 0) + counters.get('capture_dropped', 0)}"]
+    for name in ('decode', 'plot', 'report_build'):
+        h = hists.get(name)
+        if h is not None and h.count:
+            parts.append(f"{name} p50 {h.quantile(0.5) * 1e3:.1f} / p95 {h.quantile(0.95) * 1e3:.1f} ms")
+    return '   '.join(parts)
+
+
+class MetricsServer:
+    """Local HTTP endpoint for ``render_text()`` on a daemon thread."""
+
+    def __init__(self, host='127.0.0.1', port=METRICS_PORT):
+        # http.server is imported here: it is slow to import and most runs
+        # never serve metrics (see bench/bench_startup.py)
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                if self.path not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = render_text().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self.host, self.port = self._server.server_address[:2]
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        name='uro-metrics', daemon=True)
+
+    def start(self):
+        enable()
+        self._thread.start()
+        print(f'[METRICS] serving on http://{self.host}:{self.port}/metrics')
+        return self
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,117 @@
+"""Persistent, blitted flow-vs-time plot.
+
+The Figure, axes, canvas and Tk widget are created once. Each refresh only
+swaps the data of the flow ``Line2D`` and the fill polygon, restores the
+cached axes background and blits the axes area, instead of rebuilding the
+whole figure and doing a full ``canvas.draw()``. Long or high-rate sessions
+are decimated to the axes' pixel width first (see decimate.py).
+"""
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.patches import Polygon
+
+from decimate import Decimator
+
+TITLE_LIVE = 'Live Flow (stream)'
+TITLE_EMPTY = 'Live Flow (stream) — no data'
+
+
+class LivePlot:
+    """Live flow plot embedded in ``master`` (a Tk widget).
+
+    With ``master=None`` an off-screen Agg canvas is used instead, which is
+    handy for benchmarks and headless rendering.
+    """
+
+    def __init__(self, master=None, xlim=(0.0, 120.0), ylim=(0.0, 50.0),
+                 figsize=(6, 3), dpi=100, color='#2a9df4'):
+        self.fig = Figure(figsize=figsize, dpi=dpi)
+        self.ax = self.fig.add_subplot(111)
+        self.ax.set_xlabel('Time (s)')
+        self.ax.set_ylabel('Flow Rate (mL/s)')
+        self.ax.set_title(TITLE_EMPTY)
+        self.ax.grid(True, alpha=0.3)
+        self.ax.set_xlim(*xlim)
+        self.ax.set_ylim(*ylim)
+
+        # animated artists are skipped by canvas.draw() and painted by blit()
+        (self.line,) = self.ax.plot([], [], color=color, linewidth=1.5, animated=True)
+        self.fill = Polygon(np.zeros((0, 2)), closed=True, alpha=0.15,
+                            facecolor=color, edgecolor='none', animated=True)
+        self.ax.add_patch(self.fill)
+
+        if master is not None:
+            from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+            self.canvas = FigureCanvasTkAgg(self.fig, master=master)
+            self.widget = self.canvas.get_tk_widget()
+            self.widget.pack(fill='both', expand=True)
+        else:
+            from matplotlib.backends.backend_agg import FigureCanvasAgg
+            self.canvas = FigureCanvasAgg(self.fig)
+            self.widget = None
+
+        self._background = None
+        self._has_data = False
+        self.decimator = Decimator()
+        # a full draw (first show, resize, title change) re-captures the
+        # static background and repaints the animated artists on top
+        self.canvas.mpl_connect('draw_event', self._on_draw)
+        self.canvas.draw()
+
+    def _on_draw(self, event):
+        self._background = self.canvas.copy_from_bbox(self.ax.bbox)
+        self._draw_artists()
+
+    def _draw_artists(self):
+        self.ax.draw_artist(self.fill)
+        self.ax.draw_artist(self.line)
+
+    def set_limits(self, xlim=None, ylim=None):
+        if xlim is not None:
+            self.ax.set_xlim(*xlim)
+        if ylim is not None:
+            self.ax.set_ylim(*ylim)
+        self.canvas.draw()
+
+    def update(self, xs, ys, generation=None):
+        """Show ``xs``/``ys`` (sequences or NumPy arrays) and blit.
+
+        ``generation`` identifies the test the samples belong to (see
+        `decimate.Decimator.update`).
+        """
+        x0, x1 = self.ax.get_xlim()
+        xs, ys = self.decimator.update(xs, ys, x0, x1, self.ax.bbox.width, generation)
+        self.line.set_data(xs, ys)
+        n = len(xs)
+        if n:
+            # closed polygon: baseline at x0, the curve, baseline at xn
+            verts = np.empty((n + 2, 2))
+            verts[0] = (xs[0], 0.0)
+            verts[1:-1, 0] = xs
+            verts[1:-1, 1] = ys
+            verts[-1] = (xs[-1], 0.0)
+            self.fill.set_xy(verts)
+        else:
+            self.fill.set_xy(np.zeros((0, 2)))
+
+        has_data = n > 0
+        if has_data != self._has_data or self._background is None:
+            # title lives outside the axes bbox, so it needs a full draw
+            self._has_data = has_data
+            self.ax.set_title(TITLE_LIVE if has_data else TITLE_EMPTY)
+            self.canvas.draw()
+            return
+        self.blit()
+
+    def blit(self):
+        """Repaint only the axes region from the cached background."""
+        if self._background is None:
+            self.canvas.draw()
+            return
+        self.canvas.restore_region(self._background)
+        self._draw_artists()
+        self.canvas.blit(self.ax.bbox)
+
+    def clear(self):
+        self.decimator.clear()
+        self.update((), ())
@@ -0,0 +1,103 @@
+"""Uroflowmetry parameters, computed incrementally as samples arrive.
+
+``FlowMetrics`` folds each chunk of ``(times, flows)`` into running state
+(constant work per sample, nothing is rescanned), so the live screen and
+the report read finished values. ``compute_metrics`` is the same
+computation over a whole stored session in one vectorized pass.
+
+Definitions follow the usual ICS conventions. The interval between two
+samples counts as *flow* when the flow rate at its end exceeds
+``threshold``:
+
+* ``qmax``: maximum flow rate (mL/s)
+* ``volume``: voided volume, trapezoidal integral of flow (mL)
+* ``flow_time``: total time with measurable flow (s)
+* ``voiding_time``: from the onset of flow to its end, including
+  interruptions (s)
+* ``qave``: average flow rate, ``volume / flow_time`` (mL/s)
+* ``time_to_qmax``: from the onset of flow to Qmax (s)
+"""
+from collections import namedtuple
+
+import numpy as np
+
+FLOW_THRESHOLD = 0.5  # mL/s; below this the bladder is not considered voiding
+
+Metrics = namedtuple('Metrics', 'qmax qave volume time_to_qmax flow_time voiding_time')
+
+
+class FlowMetrics:
+    """Running uroflowmetry parameters for one test."""
+
+    def __init__(self, threshold=FLOW_THRESHOLD):
+        self.threshold = threshold
+        self.reset()
+
+    def reset(self):
+        self.samples = 0
+        self.qmax = 0.0
+        self.volume = 0.0
+        self.flow_time = 0.0
+        self._t_qmax = None
+        self._onset = None   # start of the first flow interval
+        self._end = None     # end of the last flow interval
+        self._last = None    # (t, q) of the previous sample, bridges chunks
+
+    def update(self, times, flows):
+        """Fold a chunk of samples (in time order) into the running values."""
+        t = np.asarray(times, dtype=np.float64)
+        q = np.asarray(flows, dtype=np.float64)
+        if not len(t):
+            return
+        i = int(q.argmax())
+        if self._t_qmax is None or q[i] > self.qmax:
+            self.qmax = float(q[i])
+            self._t_qmax = float(t[i])
+        if self._last is not None:
+            t = np.concatenate(((self._last[0],), t))
+            q = np.concatenate(((self._last[1],), q))
+        self.samples += len(times)
+        self._last = (float(t[-1]), float(q[-1]))
+        if len(t) < 2:
+            return
+        dt = np.diff(t)
+        self.volume += float(0.5 * np.dot(q[1:] + q[:-1], dt))
+        flowing = np.flatnonzero(q[1:] > self.threshold)
+        if len(flowing):
+            if self._onset is None:
+                self._onset = float(t[flowing[0]])
+            self._end = float(t[flowing[-1] + 1])
+            self.flow_time += float(dt[flowing].sum())
+
+    @property
+    def qave(self):
+        return self.volume / self.flow_time if self.flow_time > 0 else 0.0
+
+    @property
+    def voiding_time(self):
+        return self._end - self._onset if self._onset is not None else 0.0
+
+    @property
+    def time_to_qmax(self):
+        if self._onset is None or self._t_qmax is None:
+            return 0.0
+        return max(0.0, self._t_qmax - self._onset)
+
+    def snapshot(self):
+        """Current values as a (picklable) ``Metrics`` tuple."""
+        return Metrics(self.qmax, self.qave, self.volume, self.time_to_qmax,
+                       self.flow_time, self.voiding_time)
+
+
+def compute_metrics(times, flows, threshold=FLOW_THRESHOLD):
+    """``Metrics`` for a complete recording in one vectorized pass."""
+    m = FlowMetrics(threshold)
+    m.update(times, flows)
+    return m.snapshot()
+
+
+def format_metrics(m):
+    """Two-line summary for the live screen."""
+    return (f'Qmax {m.qmax:.1f} mL/s   Qave {m.qave:.1f} mL/s   Volume {m.volume:.0f} mL\n'
+            f'Flow time {m.flow_time:.1f} s   Voiding time {m.voiding_time:.1f} s   '
+            f'TQmax {m.time_to_qmax:.1f} s')
@@ -0,0 +1,200 @@
+"""Framed binary wire protocol for device sample streams.
+
+Every frame is an 18-byte little-endian header followed by ``count``
+uint16 samples::
+
+    offset size field
+         0    2 magic      b'UF'
+         2    1 version    PROTOCOL_VERSION
+         3    1 type       TYPE_SAMPLES / TYPE_END
+         4    4 seq        frame sequence number (wraps at 2**32)
+         8    4 timestamp  device time of the first sample, ms since test start
+        12    2 count      number of uint16 samples in the payload
+        14    4 crc32      zlib.crc32 over header bytes 0..13 and the payload
+
+``FrameDecoder`` is an incremental state machine: it copies incoming bytes
+into preallocated header/payload buffers through memoryviews and yields
+frames whose samples are zero-copy NumPy views.
+"""
+import struct
+import zlib
+from collections import namedtuple
+
+import numpy as np
+
+MAGIC = b'UF'
+PROTOCOL_VERSION = 1
+TYPE_SAMPLES = 0
+TYPE_END = 1        # end of test, no payload
+
+HEADER = struct.Struct('<2sBBIIHI')
+HEADER_SIZE = HEADER.size           # 18
+CRC_OFFSET = HEADER_SIZE - 4
+SEQ_MOD = 1 << 32
+
+Frame = namedtuple('Frame', 'type seq timestamp_ms samples')
+
+
+class ProtocolError(ValueError):
+    """Raised for frames that cannot be encoded."""
+
+
+def encode_frame(seq, samples=(), timestamp_ms=0, frame_type=TYPE_SAMPLES):
+    """Build one frame from ``samples`` (any uint16-compatible sequence)."""
+    payload = np.asarray(samples, dtype='<u2').tobytes()
+    count = len(payload) // 2
+    if count > 0xFFFF:
+        raise ProtocolError(f'too many samples for one frame: {count}')
+    head = HEADER.pack(MAGIC, PROTOCOL_VERSION, frame_type, seq % SEQ_MOD,
+                       int(timestamp_ms) & 0xFFFFFFFF, count, 0)
+    crc = zlib.crc32(payload, zlib.crc32(head[:CRC_OFFSET]))
+    return head[:CRC_OFFSET] + struct.pack('<I', crc) + payload
+
+
+class FrameDecoder:
+    """Incremental decoder for a byte stream of frames.
+
+    ``feed`` is a generator: ``frame.samples`` is a view into the decoder's
+    payload buffer and is only valid until the generator is resumed.
+
+    A header with an unknown version or more than ``max_samples`` samples,
+    and a frame failing its CRC, are not trusted for their length: only the
+    magic is dropped and the bytes after it are scanned again.
+
+    Counters: ``frames``, ``dropped`` (frames missing from sequence gaps),
+    ``reordered`` (late/duplicate sequence numbers; such frames are not
+    delivered since newer samples were already), ``crc_errors`` and
+    ``skipped_bytes`` (garbage discarded while resynchronising).
+    """
+
+    def __init__(self, max_samples=4096):
+        self.max_samples = max_samples
+        self._head = bytearray(HEADER_SIZE)
+        self._head_view = memoryview(self._head)
+        self._payload = bytearray(max_samples * 2)
+        self._payload_view = memoryview(self._payload)
+        self.reset()
+
+    def reset(self):
+        self._state_header = True
+        self._filled = 0
+        self._need = HEADER_SIZE
+        self._fields = None
+        self.expected_seq = None
+        self.frames = 0
+        self.dropped = 0
+        self.reordered = 0
+        self.crc_errors = 0
+        self.skipped_bytes = 0
+
+    def feed(self, data):
+        """Consume ``data`` and yield every frame it completes."""
+        mv = memoryview(data).cast('B')
+        pos = 0
+        end = len(mv)
+        while pos < end:
+            take = min(self._need - self._filled, end - pos)
+            if self._state_header:
+                if self._filled < 2:
+                    # hunt for the magic byte by byte until aligned
+                    skip = self._sync(mv, pos, end)
+                    pos += skip
+                    if pos >= end:
+                        break
+                    take = min(self._need - self._filled, end - pos)
+                self._head_view[self._filled:self._filled + take] = mv[pos:pos + take]
+            else:
+                self._payload_view[self._filled:self._filled + take] = mv[pos:pos + take]
+            self._filled += take
+            pos += take
+            if self._filled < self._need:
+                break
+            frame = None
+            if self._state_header:
+                rescan = self._on_header()
+                if rescan is None and self._need == 0:
+                    frame, rescan = self._on_payload()
+            else:
+                frame, rescan = self._on_payload()
+            if frame is not None:
+                yield frame
+            if rescan is not None:
+                # scan the bytes after the rejected magic before the rest
+                mv = memoryview(rescan + bytes(mv[pos:]))
+                pos = 0
+                end = len(mv)
+
+    def _sync(self, mv, pos, end):
+        """Return how many bytes at ``mv[pos:]`` to skip to reach the magic."""
+        start = pos
+        while pos < end:
+            b = mv[pos]
+            if self._filled == 0:
+                if b == MAGIC[0]:
+                    self._head[0] = b
+                    self._filled = 1
+                else:
+                    self.skipped_bytes += 1
+                pos += 1
+                continue
+            # _filled == 1: expecting second magic byte
+            if b == MAGIC[1]:
+                self._head[1] = b
+                self._filled = 2
+                return pos + 1 - start
+            self.skipped_bytes += 1
+            self._filled = 1 if b == MAGIC[0] else 0
+            pos += 1
+        return pos - start
+
+    def _on_header(self):
+        """Parse a complete header; returns the bytes to rescan if it is rejected."""
+        magic, version, ftype, seq, ts, count, crc = HEADER.unpack_from(self._head)
+        if version != PROTOCOL_VERSION or count > self.max_samples:
+            # not a frame we understand (or a magic inside garbage): drop the
+            # magic and resync on the rest of the header, which may hold the
+            # start of a real frame
+            self.skipped_bytes += 2
+            rescan = bytes(self._head_view[2:])
+            self._restart()
+            return rescan
+        nbytes = count * 2
+        self._fields = (ftype, seq, ts, count, crc)
+        self._state_header = False
+        self._filled = 0
+        self._need = nbytes
+
+    def _on_payload(self):
+        """Check a complete frame; returns ``(frame or None, bytes to rescan or None)``."""
+        ftype, seq, ts, count, crc = self._fields
+        payload = self._payload_view[:count * 2]
+        actual = zlib.crc32(payload, zlib.crc32(self._head_view[:CRC_OFFSET]))
+        self._restart()
+        if actual != crc:
+            # the header may be what is corrupt (or a false magic): its
+            # count is not trusted, so resync right after the magic
+            self.crc_errors += 1
+            self.skipped_bytes += 2
+            return None, bytes(self._head_view[2:]) + bytes(payload)
+        if not self._track_seq(seq):
+            return None, None
+        self.frames += 1
+        samples = np.frombuffer(payload, dtype='<u2', count=count)
+        return Frame(ftype, seq, ts, samples), None
+
+    def _track_seq(self, seq):
+        """Update gap/reorder counters; returns False for late frames."""
+        if self.expected_seq is not None and seq != self.expected_seq:
+            gap = (seq - self.expected_seq) % SEQ_MOD
+            if gap >= SEQ_MOD // 2:
+                # older than what we already delivered: count and discard
+                self.reordered += 1
+                return False
+            self.dropped += gap
+        self.expected_seq = (seq + 1) % SEQ_MOD
+        return True
+
+    def _restart(self):
+        self._state_header = True
+        self._filled = 0
+        self._need = HEADER_SIZE
@@ -0,0 +1,88 @@
+"""Event-driven, frame-rate-capped redraw scheduling for Tk.
+
+Producers call :meth:`RedrawScheduler.mark_dirty` whenever the displayed
+data changes. Bursts of updates are coalesced into at most ``max_fps``
+redraws per second, and when nothing is dirty no ``after`` callback is
+pending at all, so the scheduler is fully idle between tests.
+"""
+import time
+from collections import deque
+
+import instrumentation
+
+
+class RedrawScheduler:
+    """Coalesce redraw requests into capped-rate ``draw()`` calls on Tk."""
+
+    def __init__(self, root, draw, max_fps=10.0, history=120):
+        self.root = root
+        self.draw = draw
+        self.min_interval = 1.0 / max_fps if max_fps > 0 else 0.0
+        self._dirty = False
+        self._pending = None
+        self._last_frame = 0.0
+        self._dirty_since = None
+        self.frames = 0
+        # per-frame draw duration and dirty -> drawn latency, in seconds
+        self.draw_times = deque(maxlen=history)
+        self.latencies = deque(maxlen=history)
+        self.frame_stamps = deque(maxlen=history)
+
+    def mark_dirty(self):
+        """Request a redraw. Cheap to call many times per frame."""
+        if not self._dirty:
+            self._dirty = True
+            self._dirty_since = time.perf_counter()
+        if self._pending is None:
+            wait = self.min_interval - (time.perf_counter() - self._last_frame)
+            self._pending = self.root.after(max(0, int(wait * 1000)), self._run)
+
+    def cancel(self):
+        if self._pending is not None:
+            try:
+                self.root.after_cancel(self._pending)
+            except Exception:
+                pass
+            self._pending = None
+        self._dirty = False
+
+    def _run(self):
+        self._pending = None
+        if not self._dirty:
+            return
+        self._dirty = False
+        since = self._dirty_since
+        self._dirty_since = None
+        start = time.perf_counter()
+        try:
+            self.draw()
+        except Exception as e:
+            print(f"[PLOT] redraw failed: {e}")
+        end = time.perf_counter()
+        self._last_frame = start
+        self.frames += 1
+        self.draw_times.append(end - start)
+        instrumentation.observe('draw', end - start)
+        if since is not None:
+            self.latencies.append(end - since)
+        self.frame_stamps.append(start)
+
+    def stats(self):
+        """Achieved frame statistics over the recent history window."""
+        out = {'frames': self.frames, 'fps': 0.0, 'draw_ms_mean': 0.0,
+               'draw_ms_max': 0.0, 'latency_ms_max': 0.0}
+        if self.draw_times:
+            out['draw_ms_mean'] = 1e3 * sum(self.draw_times) / len(self.draw_times)
+            out['draw_ms_max'] = 1e3 * max(self.draw_times)
+        if self.latencies:
+            out['latency_ms_max'] = 1e3 * max(self.latencies)
+        if len(self.frame_stamps) > 1:
+            span = self.frame_stamps[-1] - self.frame_stamps[0]
+            if span > 0:
+                out['fps'] = (len(self.frame_stamps) - 1) / span
+        return out
+
+    def report(self):
+        st = self.stats()
+        return (f"{st['frames']} frames, {st['fps']:.1f} fps, draw {st['draw_ms_mean']:.1f} ms avg / "
+                f"{st['draw_ms_max']:.1f} ms max, latency {st['latency_ms_max']:.1f} ms max")
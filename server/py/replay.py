@@ -0,0 +1,161 @@
+"""Record and replay raw device sessions.
+
+A recording is a capture file (see tcpcapture.py) holding every raw payload
+with its arrival time, plus a ``.json`` sidecar describing how the session
+was acquired (mode, framing, sample interval, raw filter, calibration).
+``SessionReplay`` memory-maps
+the capture and feeds the payloads back through ``AcquisitionEngine`` at
+1x, Nx or maximum speed, so a real test can be reproduced, stress-tested
+and compared after code changes.
+"""
+import json
+import mmap
+import os
+import queue
+import time
+
+import numpy as np
+
+from calibration import Calibration
+from tcpcapture import CAPTURE_FULL, CaptureWriter, iter_records
+
+SPEED_MAX = 0  # replay without any delay
+
+
+class SessionRecorder:
+    """Record the raw payloads of one session (non-blocking, never drops)."""
+
+    def __init__(self, path, mode='batch', framed=False, sample_interval=0.3, **extra):
+        self.path = os.path.expanduser(path)
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self.meta = dict(mode=mode, framed=bool(framed), sample_interval=sample_interval,
+                         started=time.time(), **extra)
+        with open(self.path + '.json', 'w') as f:
+            json.dump(self.meta, f)
+        self._writer = CaptureWriter(self.path, level=CAPTURE_FULL, max_bytes=0, queue_size=0)
+
+    def write(self, data):
+        self._writer.write(data)
+
+    def close(self, timeout=2.0):
+        """Stop recording; ``timeout=0`` lets queued records drain in the background."""
+        self._writer.close(timeout)
+
+
+class SessionReplay:
+    """Memory-mapped view of a recorded session."""
+
+    def __init__(self, path):
+        self.path = os.path.expanduser(path)
+        meta_path = self.path + '.json'
+        self.meta = {}
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                self.meta = json.load(f)
+        self._file = open(self.path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        # (timestamp, payload view) for every record with stored bytes
+        self.records = [(ts, payload) for ts, length, payload in iter_records(self._map) if len(payload)]
+
+    @property
+    def mode(self):
+        return self.meta.get('mode', 'batch')
+
+    @property
+    def framed(self):
+        return bool(self.meta.get('framed', False))
+
+    @property
+    def sample_interval(self):
+        return float(self.meta.get('sample_interval', 0.3))
+
+    @property
+    def raw_filter(self):
+        """filters.py spec the session was decoded with (None if not recorded)."""
+        return self.meta.get('raw_filter')
+
+    @property
+    def calibration(self):
+        """A fresh `calibration.Calibration` as recorded, or None if not recorded."""
+        d = self.meta.get('calibration')
+        return Calibration.from_dict(d) if d is not None else None
+
+    @property
+    def total_bytes(self):
+        return sum(len(p) for _, p in self.records)
+
+    @property
+    def duration(self):
+        """Wall-clock span between the first and last recorded payload."""
+        if len(self.records) < 2:
+            return 0.0
+        return self.records[-1][0] - self.records[0][0]
+
+    def payload(self):
+        """All recorded bytes joined (batch sessions arrive as one frame)."""
+        return b''.join(self.records[i][1] for i in range(len(self.records)))
+
+    def chunks(self, speed=1.0, should_stop=None):
+        """Yield payload views, pacing them by arrival time / ``speed``.
+
+        ``speed=SPEED_MAX`` (0) replays as fast as the consumer keeps up.
+        """
+        start = time.monotonic()
+        t0 = self.records[0][0] if self.records else 0.0
+        for ts, payload in self.records:
+            if should_stop is not None and should_stop():
+                return
+            if speed and speed > 0:
+                delay = (ts - t0) / speed - (time.monotonic() - start)
+                if delay > 0:
+                    time.sleep(delay)
+            yield payload
+
+    def close(self):
+        self.records = []
+        try:
+            self._map.close()
+        except BufferError:
+            # a consumer still holds a view; the map goes with the last one
+            pass
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def decode_session(path, **engine_args):
+    """Decode a recorded session headlessly; returns ``(times, flows, meta)``.
+
+    Runs the same ``AcquisitionEngine`` pipeline as the app (at max speed,
+    in the calling thread) and concatenates everything it emits. The raw
+    filter and calibration default to the ones the session was recorded
+    with; pass ``raw_filter=''`` to decode unfiltered.
+    """
+    from acquisition import AcquisitionEngine, MSG_CHUNK, MSG_SAMPLES
+
+    out = queue.Queue()
+    with SessionReplay(path) as replay:
+        engine_args.setdefault('raw_filter', replay.raw_filter)
+        if engine_args.get('calibration') is None:
+            engine_args['calibration'] = replay.calibration
+        engine = AcquisitionEngine(out, replay=replay, replay_speed=SPEED_MAX, **engine_args)
+        engine.run()
+        meta = dict(replay.meta)
+    times, flows = [], []
+    while True:
+        try:
+            kind, payload = out.get_nowait()
+        except queue.Empty:
+            break
+        if kind == MSG_SAMPLES:
+            times, flows = [payload[0]], [payload[1]]
+        elif kind == MSG_CHUNK:
+            times.append(payload[0])
+            flows.append(payload[1])
+    if not times:
+        return np.empty(0), np.empty(0), meta
+    return np.concatenate(times), np.concatenate(flows), meta
@@ -0,0 +1,223 @@
+"""PDF report rendering and printing, off the Tk thread.
+
+``build_report`` is a plain function (no tkinter) so it can run in a worker
+process. ``ReportService`` renders reports in a process pool and hands the
+finished PDF to ``PrintQueue``, a background thread that spools it with
+``lp`` and retries on failure. Progress is reported through a status
+callback ``(job_id, status, detail)`` which is invoked from worker threads;
+UI code should marshal it onto its own thread (e.g. via a queue).
+"""
+import io
+import itertools
+import multiprocessing
+import queue
+import subprocess
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.lib.units import inch
+from reportlab.platypus import Image, Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+import instrumentation
+from decimate import decimate
+from metrics import compute_metrics
+
+# Job status values passed to the status callback
+STATUS_RENDERING = 'rendering'
+STATUS_RENDERED = 'rendered'
+STATUS_RENDER_FAILED = 'render-failed'
+STATUS_PRINTING = 'printing'
+STATUS_PRINT_RETRY = 'print-retry'
+STATUS_PRINTED = 'printed'
+STATUS_PRINT_FAILED = 'print-failed'
+
+DEFAULT_PRINTER = 'DCPT220'
+
+
+def build_report(file_path, xs, ys, graph_total_duration=120.0, flowrate_min=0.0, flowrate_max=50.0,
+                 recorded=None, metrics=None):
+    """Build a simple PDF containing stats and a flow graph for ``xs``/``ys``.
+
+    ``file_path`` may also be a writable file object. ``recorded`` (a
+    datetime) adds the session's recording time to the summary table.
+    ``metrics`` (a `metrics.Metrics`) is the precomputed summary; it is
+    computed from the samples when omitted.
+    """
+    xs = np.asarray(xs, dtype=np.float64)
+    ys = np.asarray(ys, dtype=np.float64)
+    if not len(xs):
+        raise ValueError('No live samples')
+
+    duration = float(xs[-1] - xs[0]) if len(xs) > 1 else 0.0
+    m = metrics if metrics is not None else compute_metrics(xs, ys)
+
+    doc = SimpleDocTemplate(file_path, pagesize=letter)
+    elements = []
+    styles = getSampleStyleSheet()
+
+    title_style = ParagraphStyle('CustomTitle', parent=styles['Heading1'], fontSize=18, textColor='#003366')
+    elements.append(Paragraph('Live Uroflowmetry Report', title_style))
+    elements.append(Spacer(1, 0.2 * inch))
+
+    rows = [['Generated:', datetime.now().strftime('%Y-%m-%d %H:%M:%S')]]
+    if recorded is not None:
+        rows.append(['Recorded:', recorded.strftime('%Y-%m-%d %H:%M:%S')])
+    rows += [
+        ['Duration (s):', f"{duration:.2f}"],
+        ['Maximum Flow Qmax (mL/s):', f"{m.qmax:.2f}"],
+        ['Average Flow Qave (mL/s):', f"{m.qave:.2f}"],
+        ['Voided Volume (mL):', f"{m.volume:.2f}"],
+        ['Time to Qmax (s):', f"{m.time_to_qmax:.2f}"],
+        ['Flow Time (s):', f"{m.flow_time:.2f}"],
+        ['Voiding Time (s):', f"{m.voiding_time:.2f}"],
+    ]
+    meta_table = Table(rows, colWidths=[2.5*inch, 3.5*inch])
+    meta_table.setStyle(TableStyle([('GRID', (0,0), (-1,-1), 0.5, '#444444')]))
+    elements.append(meta_table)
+    elements.append(Spacer(1, 0.2 * inch))
+
+    # render the plot into memory (no temp file) using this process's figure
+    png = io.BytesIO()
+    canvas = _report_canvas()
+    _draw_flow(canvas.figure.axes[0], xs, ys, graph_total_duration, flowrate_min, flowrate_max)
+    canvas.print_png(png)
+    png.seek(0)
+
+    elements.append(Image(png, width=6 * inch, height=3 * inch))
+
+    doc.build(elements)
+    return file_path
+
+
+_canvas = None
+
+
+def _report_canvas():
+    """One Agg figure per process, reused for every report it renders."""
+    global _canvas
+    if _canvas is None:
+        fig = Figure(figsize=(6, 3), dpi=100)
+        fig.add_subplot(111)
+        _canvas = FigureCanvasAgg(fig)
+    return _canvas
+
+
+def _draw_flow(ax, xs, ys, graph_total_duration, flowrate_min, flowrate_max):
+    ax.cla()
+    # at most a few points per pixel column; keeps the Qmax peak
+    xs, ys = decimate(xs, ys, 0.0, float(graph_total_duration), ax.bbox.width)
+    ax.plot(xs, ys, color='#2a9df4', linewidth=1.5)
+    ax.fill_between(xs, ys, alpha=0.15, color='#2a9df4')
+    ax.set_xlabel('Time (s)')
+    ax.set_ylabel('Flow Rate (mL/s)')
+    ax.set_title('Live Flow (stream)')
+    ax.grid(True, alpha=0.3)
+    ax.set_xlim(0.0, float(graph_total_duration))
+    ax.set_ylim(float(flowrate_min), float(flowrate_max))
+
+
+class PrintQueue:
+    """Background print spooler with retry.
+
+    Jobs are ``lp -d <printer> <file>`` invocations run one at a time on a
+    daemon thread; a failing job is retried ``retries`` times with a linear
+    backoff before ``STATUS_PRINT_FAILED`` is reported.
+    """
+
+    def __init__(self, printer=DEFAULT_PRINTER, retries=3, backoff=5.0, on_status=None,
+                 command=('lp', '-d')):
+        self.printer = printer
+        self.retries = retries
+        self.backoff = backoff
+        self.on_status = on_status
+        self.command = tuple(command)
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='uro-print-queue', daemon=True)
+        self._thread.start()
+
+    def submit(self, job_id, file_path):
+        self._queue.put((job_id, file_path))
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def _status(self, job_id, status, detail=''):
+        if self.on_status is not None:
+            try:
+                self.on_status(job_id, status, detail)
+            except Exception as e:
+                print(f"[PRINT] status callback failed: {e}")
+
+    def _run(self):
+        while True:
+            job_id, file_path = self._queue.get()
+            started = time.perf_counter()
+            for attempt in range(1, self.retries + 2):
+                self._status(job_id, STATUS_PRINTING, file_path)
+                try:
+                    subprocess.run([*self.command, self.printer, file_path], check=True,
+                                   capture_output=True, timeout=60)
+                    instrumentation.since('report_print', started)
+                    self._status(job_id, STATUS_PRINTED, f'PDF sent to printer {self.printer}')
+                    break
+                except (subprocess.CalledProcessError, subprocess.TimeoutExpired, OSError) as e:
+                    if attempt > self.retries:
+                        self._status(job_id, STATUS_PRINT_FAILED, f'Failed to print PDF: {e}')
+                        break
+                    self._status(job_id, STATUS_PRINT_RETRY, f'attempt {attempt} failed: {e}')
+                    time.sleep(self.backoff * attempt)
+
+
+class ReportService:
+    """Render reports in a worker process and queue them for printing."""
+
+    def __init__(self, on_status=None, printer=DEFAULT_PRINTER, print_reports=True, workers=1):
+        self.on_status = on_status
+        self.print_reports = print_reports
+        # spawn: never fork the Tk process (and its threads) into a worker
+        self._pool = ProcessPoolExecutor(max_workers=workers,
+                                         mp_context=multiprocessing.get_context('spawn'))
+        self.printer = PrintQueue(printer, on_status=on_status) if print_reports else None
+        self._ids = itertools.count(1)
+
+    def submit(self, file_path, xs, ys, **plot_args):
+        """Queue a report; returns the job id. ``xs``/``ys`` are copied.
+
+        ``{job}`` in ``file_path`` is replaced by the job id, so reports
+        queued close together never overwrite a file still being printed.
+        """
+        job_id = next(self._ids)
+        file_path = file_path.replace('{job}', str(job_id))
+        self._status(job_id, STATUS_RENDERING, file_path)
+        submitted = time.perf_counter()
+        future = self._pool.submit(build_report, file_path, np.array(xs), np.array(ys), **plot_args)
+        future.add_done_callback(lambda f: self._rendered(job_id, f, submitted))
+        return job_id
+
+    def _rendered(self, job_id, future, submitted):
+        try:
+            file_path = future.result()
+        except Exception as e:
+            self._status(job_id, STATUS_RENDER_FAILED, f'Failed to generate PDF: {e}')
+            return
+        instrumentation.since('report_build', submitted)
+        self._status(job_id, STATUS_RENDERED, file_path)
+        if self.printer is not None:
+            self.printer.submit(job_id, file_path)
+
+    def _status(self, job_id, status, detail=''):
+        if self.on_status is not None:
+            try:
+                self.on_status(job_id, status, detail)
+            except Exception as e:
+                print(f"[REPORT] status callback failed: {e}")
+
+    def shutdown(self, wait=False):
+        self._pool.shutdown(wait=wait, cancel_futures=not wait)
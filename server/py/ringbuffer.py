@@ -0,0 +1,108 @@
+"""Fixed-capacity, array-backed ring buffer for (time, flow) samples.
+
+Each column is stored twice in a ``2 * capacity`` array (every write goes
+to ``i`` and ``i + capacity``), so the most recent ``len(ring)`` samples
+are always one contiguous slice. That lets :meth:`SampleRing.view` hand out
+zero-copy NumPy views for plotting and reporting while appends stay O(1).
+"""
+import numpy as np
+
+
+def capacity_for(graph_total_duration, sample_interval):
+    """Number of samples that fit in the displayed test duration."""
+    return max(1, int(graph_total_duration / sample_interval))
+
+
+class SampleRing:
+    """Ring buffer of ``(time, flow)`` pairs keeping the newest ``capacity``."""
+
+    def __init__(self, capacity, dtype=np.float64):
+        if capacity <= 0:
+            raise ValueError('capacity must be positive')
+        self.capacity = int(capacity)
+        self._t = np.zeros(2 * self.capacity, dtype=dtype)
+        self._y = np.zeros(2 * self.capacity, dtype=dtype)
+        self._pos = 0     # next write index in [0, capacity)
+        self._count = 0
+        # bumped on every mutation so consumers can detect in-place updates
+        self.version = 0
+        # bumped by clear(): samples before and after belong to different tests
+        self.generation = 0
+
+    def __len__(self):
+        return self._count
+
+    def __bool__(self):
+        return self._count > 0
+
+    def clear(self):
+        self._pos = 0
+        self._count = 0
+        self.version += 1
+        self.generation += 1
+
+    def append(self, t, y):
+        p = self._pos
+        self._t[p] = self._t[p + self.capacity] = t
+        self._y[p] = self._y[p + self.capacity] = y
+        self._pos = (p + 1) % self.capacity
+        if self._count < self.capacity:
+            self._count += 1
+        self.version += 1
+
+    def extend(self, ts, ys):
+        """Append many samples at once (only the newest ``capacity`` are kept)."""
+        ts = np.asarray(ts)
+        ys = np.asarray(ys)
+        if len(ts) != len(ys):
+            raise ValueError('times and flows must have the same length')
+        k = len(ts)
+        if k == 0:
+            return
+        if k > self.capacity:
+            ts = ts[-self.capacity:]
+            ys = ys[-self.capacity:]
+            k = self.capacity
+        cap = self.capacity
+        p = self._pos
+        first = min(k, cap - p)
+        for arr, src in ((self._t, ts), (self._y, ys)):
+            arr[p:p + first] = src[:first]
+            arr[p + cap:p + cap + first] = src[:first]
+            rest = k - first
+            if rest:
+                arr[:rest] = src[first:]
+                arr[cap:cap + rest] = src[first:]
+        self._pos = (p + k) % cap
+        self._count = min(cap, self._count + k)
+        self.version += 1
+
+    def _slice(self):
+        start = (self._pos - self._count) % self.capacity
+        return slice(start, start + self._count)
+
+    def view(self):
+        """Return read-only ``(times, flows)`` views, oldest sample first.
+
+        The views alias the ring storage and are only valid until the next
+        mutation; copy them if they must outlive it.
+        """
+        sl = self._slice()
+        t = self._t[sl]
+        y = self._y[sl]
+        t.flags.writeable = False
+        y.flags.writeable = False
+        return t, y
+
+    def times(self):
+        return self.view()[0]
+
+    def flows(self):
+        return self.view()[1]
+
+    def last(self):
+        """Most recent ``(time, flow)`` pair, or None if empty."""
+        if not self._count:
+            return None
+        i = (self._pos - 1) % self.capacity
+        return float(self._t[i]), float(self._y[i])
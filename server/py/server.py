@@ -1,18 +1,258 @@
-import socket
-
-def start_tcp_server(host='127.0.0.1', port=65432):
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server_socket:
-        server_socket.bind((host, port))
-        server_socket.listen()
-        print(f'Server listening on {host}:{port}')
-        
-        conn, addr = server_socket.accept()
-        with conn:
-            print(f'Connected by {addr}')
-
-            data = {5,7,8,11,13,7,19,23,29,22,19,17,13,11,7}
-            print(f'Sending data: {data}')
-            conn.sendall(str(data).encode())  # Echo back the received data
+"""Concurrent collector for many Pico W uroflowmeter stations.
+
+Each station connects as a TCP client (see picow_tcp_client.c), receives
+the framed streaming command and pushes protocol.py frames. Every
+connection gets its own ``DeviceSession`` (frame + flow decoders, counters,
+optional recording). Reads are bounded chunks and decoded samples go
+through a bounded per-session queue, so a slow consumer applies TCP
+backpressure to its device instead of growing memory. Silent devices are
+dropped after ``idle_timeout`` seconds.
+"""
+import argparse
+import asyncio
+import os
+import time
+from collections import deque
+
+import numpy as np
+
+import instrumentation
+from calibration import Calibration, CalibrationStore
+from decode import StreamDecoder
+from filters import make_filter
+from metrics import FlowMetrics
+from protocol import TYPE_END, FrameDecoder
+from replay import SessionRecorder
+from sessionstore import STATUS_COMPLETE, STATUS_FAILED, SessionStore
+
+CMD_STREAM_FRAMED = b'\x30\x32'
+READ_CHUNK = 4096
+
+
+class DeviceSession:
+    """Per-connection state for one station's test."""
+
+    def __init__(self, device_id, sample_interval=0.3, flowrate_min=0.0, flowrate_max=50.0,
+                 raw_filter=None, calibration=None):
+        self.device_id = device_id
+        self.sample_interval = sample_interval
+        self.started = time.time()
+        self.ended = None
+        self.frames = FrameDecoder()
+        self.decoder = StreamDecoder(sample_interval, flowrate_min, flowrate_max,
+                                     raw_filter=make_filter(raw_filter),
+                                     calibration=calibration)
+        self.bytes = 0
+        self.samples = 0
+        self.metrics = FlowMetrics()
+        self.complete = False
+        self.reason = ''
+        self._chunks = []
+
+    def feed(self, data):
+        """Decode ``data``; returns a list of ``(times, flows)`` chunks."""
+        self.bytes += len(data)
+        received = time.perf_counter() if instrumentation.enabled else None
+        instrumentation.count('payloads')
+        instrumentation.count('bytes', len(data))
+        out = []
+        for frame in self.frames.feed(data):
+            if frame.type == TYPE_END:
+                self.complete = True
+                break
+            times, flows = self.decoder.feed_frame(frame, self.frames.dropped)
+            if len(times):
+                instrumentation.count('samples', len(times))
+                out.append((times, flows))
+        instrumentation.since('decode', received)
+        return out
+
+    def consume(self, times, flows):
+        """Default sink: keep the samples and update the running metrics."""
+        self.samples += len(times)
+        self.metrics.update(times, flows)
+        self._chunks.append((times, flows))
+
+    def arrays(self):
+        """All received samples as ``(times, flows)`` arrays."""
+        if not self._chunks:
+            return np.empty(0), np.empty(0)
+        return (np.concatenate([c[0] for c in self._chunks]),
+                np.concatenate([c[1] for c in self._chunks]))
+
+    def summary(self):
+        f = self.frames
+        m = self.metrics
+        return (f"{self.device_id}: {self.samples} samples, {self.bytes} bytes, "
+                f"Qmax {m.qmax:.1f} mL/s, Qave {m.qave:.1f} mL/s, volume {m.volume:.0f} mL, "
+                f"flow time {m.flow_time:.1f} s, "
+                f"{f.dropped} dropped / {f.reordered} reordered / {f.crc_errors} CRC errors, "
+                f"{self.reason or ('complete' if self.complete else 'open')}")
+
+
+class Collector:
+    """asyncio TCP server handling many device sessions at once."""
+
+    def __init__(self, host='0.0.0.0', port=4242, idle_timeout=30.0, max_clients=64,
+                 queue_size=64, sample_interval=0.3, record_dir=None,
+                 start_command=CMD_STREAM_FRAMED, on_session_end=None, raw_filter=None,
+                 store_dir=None, calibration_path=None):
+        self.host = host
+        self.port = port
+        self.idle_timeout = idle_timeout
+        self.max_clients = max_clients
+        self.queue_size = queue_size
+        self.sample_interval = sample_interval
+        self.record_dir = os.path.expanduser(record_dir) if record_dir else None
+        self.start_command = start_command
+        self.on_session_end = on_session_end
+        # filters.py spec applied to every session's raw readings
+        self.raw_filter = raw_filter
+        # decoded samples + metrics of every session (sessionstore.py)
+        self.store = SessionStore(store_dir) if store_dir else None
+        if self.store is not None:
+            # nothing is writing yet: sessions still 'recording' were cut short
+            interrupted = self.store.recover()
+            if interrupted:
+                print(f"[STORE] {interrupted} interrupted session(s) recovered")
+        # per-device load-cell calibrations (calibration.py), looked up by
+        # device host; devices without one use the default linear mapping
+        self.calibrations = CalibrationStore(calibration_path) if calibration_path else None
+        self.sessions = {}
+        # most recent finished sessions (bounded so a long-running collector
+        # does not keep every test in memory)
+        self.finished = deque(maxlen=256)
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port,
+                                                  limit=READ_CHUNK * 4)
+        sock = self._server.sockets[0].getsockname()
+        self.port = sock[1]
+        print(f'Collector listening on {sock[0]}:{sock[1]}')
+        return self._server
+
+    async def serve_forever(self):
+        if self._server is None:
+            await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    def close(self):
+        if self._server is not None:
+            self._server.close()
+
+    async def _handle(self, reader, writer):
+        peer = writer.get_extra_info('peername')
+        # a device is its host: the source port changes on every connection
+        device_id = peer[0] if peer else 'unknown'
+        conn_id = f'{device_id}:{peer[1]}' if peer else f'unknown:{id(writer)}'
+        if len(self.sessions) >= self.max_clients:
+            print(f'Rejecting {device_id}: {self.max_clients} sessions already active')
+            instrumentation.count('sessions_rejected')
+            writer.close()
+            return
+        calibration = (self.calibrations.get(device_id) if self.calibrations is not None
+                       else Calibration.linear())
+        session = DeviceSession(device_id, self.sample_interval, raw_filter=self.raw_filter,
+                                calibration=calibration)
+        self.sessions[conn_id] = session
+        instrumentation.count('sessions')
+        recorder = None
+        if self.record_dir:
+            name = f"{conn_id.replace(':', '_')}_{int(session.started)}.cap"
+            recorder = SessionRecorder(os.path.join(self.record_dir, name), mode='stream',
+                                       framed=True, sample_interval=self.sample_interval,
+                                       device=device_id, raw_filter=self.raw_filter,
+                                       calibration=calibration.to_dict())
+        store_writer = None
+        if self.store is not None:
+            store_writer = self.store.begin(device_id, sample_interval=self.sample_interval,
+                                            raw_filter=self.raw_filter,
+                                            calibration=calibration.to_dict())
+        samples = asyncio.Queue(maxsize=self.queue_size)
+        sink = asyncio.create_task(self._drain(session, samples, store_writer))
+        print(f'Connected by {device_id}')
+        try:
+            if self.start_command:
+                writer.write(self.start_command)
+                await writer.drain()
+            while not session.complete:
+                try:
+                    data = await asyncio.wait_for(reader.read(READ_CHUNK), self.idle_timeout)
+                except asyncio.TimeoutError:
+                    session.reason = f'idle for {self.idle_timeout:.0f} s'
+                    break
+                if not data:
+                    session.reason = 'closed by device'
+                    break
+                if recorder is not None:
+                    recorder.write(data)
+                for chunk in session.feed(data):
+                    # blocks (and stops reading this socket) when the sink lags
+                    await samples.put(chunk)
+        except (ConnectionError, OSError) as e:
+            session.reason = f'connection error: {e}'
+        finally:
+            await samples.put(None)
+            await sink
+            session.ended = time.time()
+            f = session.frames
+            instrumentation.count('frames', f.frames)
+            instrumentation.count('frames_dropped', f.dropped)
+            instrumentation.count('frames_reordered', f.reordered)
+            instrumentation.count('crc_errors', f.crc_errors)
+            if recorder is not None:
+                recorder.close(timeout=0)
+            if store_writer is not None:
+                store_writer.close(STATUS_COMPLETE if session.complete else STATUS_FAILED,
+                             metrics=session.metrics.snapshot(), timeout=0)
+            del self.sessions[conn_id]
+            self.finished.append(session)
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+            print(f'Session ended: {session.summary()}')
+            if self.on_session_end is not None:
+                self.on_session_end(session)
+
+    async def _drain(self, session, samples, store_writer=None):
+        while True:
+            chunk = await samples.get()
+            if chunk is None:
+                return
+            session.consume(*chunk)
+            if store_writer is not None:
+                store_writer.append(*chunk)
+
+
+def start_tcp_server(host='0.0.0.0', port=4242, **kwargs):
+    collector = Collector(host, port, **kwargs)
+    try:
+        asyncio.run(collector.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    return collector
+
 
 if __name__ == '__main__':
-    start_tcp_server()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Multi-device uroflowmetry collector')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=4242)
+    parser.add_argument('--idle-timeout', type=float, default=30.0)
+    parser.add_argument('--max-clients', type=int, default=64)
+    parser.add_argument('--record-dir', help='record every session here for replay')
+    parser.add_argument('--store-dir', help='keep every session in a session store (sessionstore.py)')
+    parser.add_argument('--filter', help="raw reading filter, e.g. 'median:5' (see filters.py)")
+    parser.add_argument('--calibration', help='per-device calibration file (see calibration.py)')
+    parser.add_argument('--metrics-port', type=int, default=0,
+                        help='serve counters/latencies on this local HTTP port (0 = off)')
+    args = parser.parse_args()
+    if args.metrics_port:
+        instrumentation.MetricsServer(port=args.metrics_port).start()
+    start_tcp_server(args.host, args.port, idle_timeout=args.idle_timeout,
+                     max_clients=args.max_clients, record_dir=args.record_dir,
+                     raw_filter=args.filter, store_dir=args.store_dir,
+                     calibration_path=args.calibration)
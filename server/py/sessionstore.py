@@ -0,0 +1,257 @@
+"""Durable store of decoded test sessions.
+
+Layout under the store directory::
+
+    sessions.db                      SQLite (WAL) index: one row per session
+    samples/0000/<id>.times.f8       float64 sample times, append-only
+    samples/0000/<id>.flows.f8       float64 flow rates, append-only
+
+The index holds device, start/end time, status, the committed sample count
+and the session's metrics (see metrics.py), indexed by device and start
+time for history and trend queries. Sample columns are raw little-endian
+float64 files, so loading a session is a memory map and no parsing is
+needed.
+
+``SessionWriter`` streams samples in during a test on a background thread.
+Every ``sync_interval`` seconds it fsyncs the columns and only then
+commits the new sample count. After a crash a session therefore loses at
+most the last interval, and loads never see a torn tail.
+"""
+import argparse
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+STATUS_RECORDING = 'recording'
+STATUS_COMPLETE = 'complete'
+STATUS_CANCELLED = 'cancelled'
+STATUS_FAILED = 'failed'
+STATUS_INTERRUPTED = 'interrupted'   # writer died (crash / power loss)
+
+METRIC_COLUMNS = ('qmax', 'qave', 'volume', 'time_to_qmax', 'flow_time', 'voiding_time')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    device TEXT NOT NULL,
+    started REAL NOT NULL,
+    ended REAL,
+    sample_interval REAL NOT NULL,
+    samples INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL,
+    qmax REAL, qave REAL, volume REAL, time_to_qmax REAL, flow_time REAL, voiding_time REAL,
+    meta TEXT
+);
+CREATE INDEX IF NOT EXISTS sessions_device_started ON sessions (device, started);
+CREATE INDEX IF NOT EXISTS sessions_started ON sessions (started);
+'''
+
+_STOP = object()
+
+
+class SessionStore:
+    """Index + sample columns for every recorded test."""
+
+    def __init__(self, root='~/uro_store'):
+        self.root = os.path.expanduser(root)
+        os.makedirs(os.path.join(self.root, 'samples'), exist_ok=True)
+        self.db_path = os.path.join(self.root, 'sessions.db')
+        with self._connect() as db:
+            db.executescript(SCHEMA)
+
+    def _connect(self):
+        db = sqlite3.connect(self.db_path, timeout=10.0)
+        db.row_factory = sqlite3.Row
+        db.execute('PRAGMA journal_mode=WAL')
+        db.execute('PRAGMA synchronous=NORMAL')
+        return db
+
+    def _paths(self, session_id):
+        shard = os.path.join(self.root, 'samples', f'{session_id // 1000:04d}')
+        return (os.path.join(shard, f'{session_id}.times.f8'),
+                os.path.join(shard, f'{session_id}.flows.f8'))
+
+    def begin(self, device, sample_interval=0.3, sync_interval=1.0, **meta):
+        """Start a session; returns its ``SessionWriter``.
+
+        ``meta`` (JSON-serializable) is stored with the session.
+        """
+        with self._connect() as db:
+            cur = db.execute(
+                'INSERT INTO sessions (device, started, sample_interval, status, meta) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (device, time.time(), float(sample_interval), STATUS_RECORDING, json.dumps(meta)))
+            session_id = cur.lastrowid
+        return SessionWriter(self, session_id, sync_interval)
+
+    def recover(self):
+        """Mark sessions left ``recording`` by a dead writer as interrupted.
+
+        Only call this when no writer is active (e.g. at app start).
+        Returns the number of sessions marked.
+        """
+        with self._connect() as db:
+            return db.execute('UPDATE sessions SET status = ? WHERE status = ?',
+                              (STATUS_INTERRUPTED, STATUS_RECORDING)).rowcount
+
+    def find(self, device=None, since=None, until=None, status=None, limit=100):
+        """Session rows (newest first) as dicts, filtered by device/time/status."""
+        where, args = [], []
+        for clause, value in (('device = ?', device), ('started >= ?', since),
+                              ('started < ?', until), ('status = ?', status)):
+            if value is not None:
+                where.append(clause)
+                args.append(value)
+        sql = 'SELECT * FROM sessions'
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += ' ORDER BY started DESC LIMIT ?'
+        with self._connect() as db:
+            return [self._row(r) for r in db.execute(sql, (*args, limit))]
+
+    def get(self, session_id):
+        with self._connect() as db:
+            row = db.execute('SELECT * FROM sessions WHERE id = ?', (session_id,)).fetchone()
+        if row is None:
+            raise KeyError(f'no session {session_id}')
+        return self._row(row)
+
+    def load(self, session_id):
+        """``(times, flows, row)``; the arrays are read-only memory maps."""
+        row = self.get(session_id)
+        n = row['samples']
+        if not n:
+            return np.empty(0), np.empty(0), row
+        times_path, flows_path = self._paths(session_id)
+        times = np.memmap(times_path, dtype='<f8', mode='r', shape=(n,))
+        flows = np.memmap(flows_path, dtype='<f8', mode='r', shape=(n,))
+        return times, flows, row
+
+    @staticmethod
+    def _row(row):
+        out = dict(row)
+        out['meta'] = json.loads(out['meta']) if out['meta'] else {}
+        return out
+
+
+class SessionWriter:
+    """Append samples to one session from any thread (never blocks on I/O)."""
+
+    def __init__(self, store, session_id, sync_interval=1.0):
+        self.store = store
+        self.session_id = session_id
+        self.sync_interval = sync_interval
+        self.samples = 0      # committed to the index
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='uro-session-store', daemon=True)
+        self._thread.start()
+
+    def append(self, times, flows):
+        """Queue a chunk of samples. The arrays must not be modified afterwards."""
+        if len(times):
+            self._queue.put((np.asarray(times, dtype='<f8'), np.asarray(flows, dtype='<f8')))
+
+    def close(self, status=STATUS_COMPLETE, metrics=None, timeout=5.0):
+        """Finish the session; ``metrics`` is a `metrics.Metrics` summary.
+
+        With ``timeout=0`` the remaining writes finish in the background.
+        """
+        if self._thread is None:
+            return
+        self._queue.put((_STOP, status, metrics))
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        times_path, flows_path = self.store._paths(self.session_id)
+        os.makedirs(os.path.dirname(times_path), exist_ok=True)
+        db = self.store._connect()
+        tf = open(times_path, 'ab')
+        ff = open(flows_path, 'ab')
+        written = 0
+        next_sync = time.monotonic() + self.sync_interval
+
+        def checkpoint():
+            # columns reach the disk before the index says they exist
+            for f in (tf, ff):
+                f.flush()
+                os.fsync(f.fileno())
+            with db:
+                db.execute('UPDATE sessions SET samples = ? WHERE id = ?', (written, self.session_id))
+            self.samples = written
+
+        try:
+            while True:
+                try:
+                    item = self._queue.get(timeout=max(0.0, next_sync - time.monotonic()))
+                except queue.Empty:
+                    item = None
+                if item is not None and item[0] is _STOP:
+                    _, status, metrics = item
+                    break
+                if item is not None:
+                    times, flows = item
+                    tf.write(memoryview(np.ascontiguousarray(times)))
+                    ff.write(memoryview(np.ascontiguousarray(flows)))
+                    written += len(times)
+                if time.monotonic() >= next_sync:
+                    if written != self.samples:
+                        checkpoint()
+                    next_sync = time.monotonic() + self.sync_interval
+            checkpoint()
+            values = [getattr(metrics, c) if metrics is not None else None for c in METRIC_COLUMNS]
+            with db:
+                db.execute('UPDATE sessions SET status = ?, ended = ?, '
+                           + ', '.join(f'{c} = ?' for c in METRIC_COLUMNS) + ' WHERE id = ?',
+                           (status, time.time(), *values, self.session_id))
+        except (OSError, sqlite3.Error) as e:
+            print(f"[STORE] session {self.session_id} write failed: {e}")
+        finally:
+            tf.close()
+            ff.close()
+            db.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Browse the uroflowmetry session store')
+    parser.add_argument('--store', default='~/uro_store')
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    ls = sub.add_parser('list', help='list sessions, newest first')
+    ls.add_argument('--device')
+    ls.add_argument('--limit', type=int, default=20)
+    rep = sub.add_parser('report', help='render the PDF report of a stored session')
+    rep.add_argument('session_id', type=int)
+    rep.add_argument('-o', '--out', help='PDF path (default: <id>.pdf)')
+    args = parser.parse_args(argv)
+
+    store = SessionStore(args.store)
+    if args.cmd == 'list':
+        for r in store.find(device=args.device, limit=args.limit):
+            started = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(r['started']))
+            qmax = f"{r['qmax']:.1f}" if r['qmax'] is not None else '-'
+            volume = f"{r['volume']:.0f}" if r['volume'] is not None else '-'
+            print(f"{r['id']:>6}  {started}  {r['device']:<22} {r['status']:<11} "
+                  f"{r['samples']:>7} samples  Qmax {qmax} mL/s  volume {volume} mL")
+        return 0
+    from datetime import datetime
+    from metrics import Metrics
+    from reporting import build_report
+    times, flows, row = store.load(args.session_id)
+    if not len(times):
+        print(f'session {args.session_id} has no samples')
+        return 1
+    out = args.out or f'{args.session_id}.pdf'
+    # stored metrics are used as is (sessions that never finished have none)
+    metrics = Metrics(*(row[c] for c in METRIC_COLUMNS)) if row['qmax'] is not None else None
+    build_report(out, times, flows, recorded=datetime.fromtimestamp(row['started']), metrics=metrics)
+    print(out)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
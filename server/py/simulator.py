@@ -0,0 +1,218 @@
+"""Local stand-in for the Pico W uroflowmeter.
+
+Listens like the device firmware (HX711 load cell read every 300 ms, see
+picow_tcpip_client/picow_tcp_client.c) and answers the start commands used
+by ``acquisition.py``:
+
+    0x30 0x30  send the whole test as one raw uint16 batch at the end
+    0x30 0x31  stream raw uint16 samples as they are "measured"
+    0x30 0x32  stream samples as protocol.py frames, then an end frame
+
+Sample rate, send jitter and TCP segmentation are configurable, so the
+ingestion path can be exercised without hardware::
+
+    python simulator.py --port 4244                      # point the app at 127.0.0.1
+    python simulator.py --port 4244 --devices 4          # 4 devices on ports 4244..4247
+    python simulator.py --connect 127.0.0.1:4242 --devices 40 --speed 0
+                                                         # load test the collector (server.py)
+
+With ``--connect`` each simulated device dials the collector (as the
+firmware does), waits for its start command and streams one test; a
+throughput summary is printed at the end.
+"""
+import argparse
+import socket
+import threading
+import time
+
+import numpy as np
+
+from protocol import TYPE_END, encode_frame
+
+CMD_START = b'\x30\x30'
+CMD_STREAM = b'\x30\x31'
+CMD_STREAM_FRAMED = b'\x30\x32'
+
+
+def synthetic_curve(n_samples=400, volume_ml=350.0, raw_per_ml=1.2, seed=None):
+    """Cumulative load-cell readings for a bell-shaped void, as uint16."""
+    rng = np.random.default_rng(seed)
+    t = np.linspace(0.0, 1.0, n_samples)
+    start, end = 0.1, 0.6
+    phase = np.clip((t - start) / (end - start), 0.0, 1.0)
+    # cumulative volume follows a smooth S-curve (integral of a sin^2 flow)
+    cumulative = volume_ml * (phase - np.sin(2 * np.pi * phase) / (2 * np.pi))
+    raw = cumulative * raw_per_ml + rng.normal(0.0, 0.5, n_samples)
+    return np.clip(np.round(raw), 0, 65535).astype('<u2')
+
+
+def device_curve(n_samples, device=0):
+    """A different (reproducible) void for every simulated device."""
+    rng = np.random.default_rng(device)
+    return synthetic_curve(n_samples, volume_ml=float(rng.uniform(150.0, 550.0)), seed=device)
+
+
+def _send(conn, data, segment, rng):
+    """Send ``data``, split into random writes of 1..``segment`` bytes."""
+    if not segment:
+        conn.sendall(data)
+        return
+    view = memoryview(data)
+    pos = 0
+    while pos < len(view):
+        n = int(rng.integers(1, segment + 1))
+        conn.sendall(view[pos:pos + n])
+        pos += n
+
+
+def serve_client(conn, samples, sample_interval, speed, frame_samples, jitter=0.0, segment=0,
+                 rng=None):
+    """Answer one start command on ``conn``; returns the number of bytes sent.
+
+    Sends are paced against the test clock (no drift) and each one is
+    delayed by up to ``jitter`` seconds more. ``segment`` > 0 splits every
+    payload into random small writes.
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    if segment:
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    cmd = conn.recv(2)
+    print(f"[SIM] command {cmd!r}")
+    delay = sample_interval / speed if speed > 0 else 0.0
+    start = time.monotonic()
+    sent = 0
+
+    def wait(n_done):
+        # sleep until sample `n_done` is due, plus send jitter
+        if delay or jitter:
+            due = start + n_done * delay + (rng.uniform(0.0, jitter) if jitter else 0.0)
+            pause = due - time.monotonic()
+            if pause > 0:
+                time.sleep(pause)
+
+    if cmd == CMD_STREAM:
+        for i in range(0, len(samples), frame_samples):
+            chunk = samples[i:i + frame_samples]
+            wait(i + len(chunk))
+            _send(conn, chunk.tobytes(), segment, rng)
+            sent += chunk.nbytes
+    elif cmd == CMD_STREAM_FRAMED:
+        seq = 0
+        for i in range(0, len(samples), frame_samples):
+            chunk = samples[i:i + frame_samples]
+            ts_ms = int(round(i * sample_interval * 1000))
+            wait(i + len(chunk))
+            frame = encode_frame(seq, chunk, ts_ms)
+            _send(conn, frame, segment, rng)
+            sent += len(frame)
+            seq += 1
+        frame = encode_frame(seq, (), 0, TYPE_END)
+        _send(conn, frame, segment, rng)
+        sent += len(frame)
+    else:
+        wait(len(samples))
+        _send(conn, samples.tobytes(), segment, rng)
+        sent += samples.nbytes
+    return sent
+
+
+def listen(host, port, args, device=0):
+    """Act as one device: serve every connection on ``host:port`` in turn."""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as srv:
+        srv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        srv.bind((host, port))
+        srv.listen()
+        print(f"[SIM] device {device} listening on {host}:{port}")
+        while True:
+            conn, addr = srv.accept()
+            with conn:
+                print(f"[SIM] device {device} connected by {addr}")
+                try:
+                    serve_client(conn, device_curve(args.samples, device), args.interval,
+                                 args.speed, args.frame_samples, args.jitter, args.segment)
+                except OSError as e:
+                    print(f"[SIM] client dropped: {e}")
+
+
+def run_devices(host, port, devices, samples=400, sample_interval=0.3, speed=1.0,
+                frame_samples=4, jitter=0.0, segment=0):
+    """Load generator: ``devices`` concurrent devices dial ``host:port``.
+
+    Every device waits for the collector's start command and streams one
+    test. Returns a list of ``(device, bytes_sent, seconds, error)``.
+    """
+    results = [None] * devices
+
+    def run(device):
+        t0 = time.perf_counter()
+        try:
+            with socket.create_connection((host, port), timeout=30) as conn:
+                sent = serve_client(conn, device_curve(samples, device), sample_interval, speed,
+                                    frame_samples, jitter, segment,
+                                    rng=np.random.default_rng(device))
+                conn.shutdown(socket.SHUT_WR)
+                # wait for the collector to close its side
+                while conn.recv(4096):
+                    pass
+            results[device] = (device, sent, time.perf_counter() - t0, None)
+        except OSError as e:
+            results[device] = (device, 0, time.perf_counter() - t0, str(e))
+
+    threads = [threading.Thread(target=run, args=(d,), name=f'uro-sim-{d}', daemon=True)
+               for d in range(devices)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Pico W uroflowmeter simulator')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=4244)
+    parser.add_argument('--connect', metavar='HOST:PORT',
+                        help='dial a collector (server.py) instead of listening')
+    parser.add_argument('--devices', type=int, default=1, help='number of simulated devices')
+    parser.add_argument('--samples', type=int, default=400)
+    parser.add_argument('--interval', type=float, default=0.3, help='seconds per sample')
+    parser.add_argument('--rate', type=float, help='samples per second (overrides --interval)')
+    parser.add_argument('--speed', type=float, default=1.0, help='time scale, 0 = no delay')
+    parser.add_argument('--frame-samples', type=int, default=4, help='samples per streamed chunk')
+    parser.add_argument('--jitter', type=float, default=0.0, help='max extra delay per send (s)')
+    parser.add_argument('--segment', type=int, default=0,
+                        help='split payloads into random writes of at most this many bytes')
+    args = parser.parse_args(argv)
+    if args.rate:
+        args.interval = 1.0 / args.rate
+
+    if args.connect:
+        host, _, port = args.connect.rpartition(':')
+        t0 = time.perf_counter()
+        results = run_devices(host or '127.0.0.1', int(port), args.devices, args.samples,
+                              args.interval, args.speed, args.frame_samples, args.jitter,
+                              args.segment)
+        elapsed = time.perf_counter() - t0
+        failed = [r for r in results if r[3]]
+        total = sum(r[1] for r in results)
+        for device, _, _, err in failed:
+            print(f"[SIM] device {device} failed: {err}")
+        print(f"[SIM] {args.devices} devices, {args.devices * args.samples} samples, "
+              f"{total} bytes in {elapsed:.2f} s ({args.devices * args.samples / elapsed:.0f} samples/s, "
+              f"{total / elapsed / 1e6:.2f} MB/s), {len(failed)} failed")
+        return 1 if failed else 0
+
+    threads = [threading.Thread(target=listen, args=(args.host, args.port + d, args, d),
+                                name=f'uro-sim-{d}', daemon=True) for d in range(args.devices)]
+    for t in threads:
+        t.start()
+    try:
+        for t in threads:
+            t.join()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,85 @@
+"""Full-frame socket reader.
+
+TCP does not preserve message boundaries: the Pico W's lwIP stack may hand
+the 800-byte sample batch over in several segments. ``FrameReader`` keeps
+calling ``recv_into`` on a preallocated buffer until a whole frame has
+arrived, so the read path does not allocate or copy per chunk.
+"""
+import socket
+import time
+
+
+class FrameReader:
+    """Read fixed-size frames from a connected socket.
+
+    The returned frame is a ``memoryview`` into the reader's own buffer and
+    is only valid until the next call to :meth:`read_frame`; copy it with
+    ``bytes(frame)`` if it must outlive that.
+    """
+
+    def __init__(self, sock, frame_size):
+        if frame_size <= 0:
+            raise ValueError('frame_size must be positive')
+        self.sock = sock
+        self.frame_size = frame_size
+        self._buf = bytearray(frame_size)
+        self._view = memoryview(self._buf)
+        self._filled = 0
+        self.eof = False
+
+    @property
+    def filled(self):
+        """Bytes of the current frame received so far."""
+        return self._filled
+
+    @property
+    def progress(self):
+        """Fraction (0.0 - 1.0) of the current frame received so far."""
+        return self._filled / self.frame_size
+
+    def reset(self):
+        self._filled = 0
+
+    def read_some(self):
+        """Perform one ``recv_into`` and return the number of bytes read.
+
+        Returns 0 when the peer closed the connection. ``socket.timeout`` is
+        propagated so callers can check for cancellation between reads.
+        """
+        if self._filled >= self.frame_size:
+            self._filled = 0
+        n = self.sock.recv_into(self._view[self._filled:], self.frame_size - self._filled)
+        if n == 0:
+            self.eof = True
+        self._filled += n
+        return n
+
+    def read_frame(self, should_stop=None, timeout=None, on_progress=None):
+        """Block until a complete frame has arrived.
+
+        ``should_stop`` is polled after every read/timeout slice; ``timeout``
+        bounds the total wait in seconds. ``on_progress(filled, frame_size)``
+        is called after every chunk. Returns a memoryview of the complete
+        frame, a shorter view if the peer closed mid-frame, or ``None`` if
+        stopped, timed out or nothing was received.
+        """
+        if self._filled >= self.frame_size:
+            self._filled = 0
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._filled < self.frame_size:
+            if should_stop is not None and should_stop():
+                return None
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            try:
+                n = self.read_some()
+            except socket.timeout:
+                continue
+            if n == 0:
+                if self._filled == 0:
+                    return None
+                print(f"[TCP READ] Connection closed after {self._filled}/{self.frame_size} bytes")
+                return self._view[:self._filled]
+            if on_progress is not None:
+                on_progress(self._filled, self.frame_size)
+        return self._view[:self.frame_size]
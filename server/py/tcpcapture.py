@@ -0,0 +1,185 @@
+"""Asynchronous, rate-limited capture of raw TCP payloads.
+
+``CaptureWriter.write`` only does a level check and a non-blocking put on a
+bounded queue; a daemon thread appends compact binary records to the
+capture file and rotates it by size. When the queue is full, payloads are
+dropped (and counted) rather than stalling the acquisition thread; so are
+payloads written after ``close()``.
+
+File layout: ``FILE_MAGIC`` followed by records of::
+
+    <d  timestamp   time.time() when the payload was captured
+    <I  length      original payload length in bytes
+    <I  stored      bytes of payload that follow (0 at CAPTURE_SUMMARY)
+        payload
+"""
+import os
+import queue
+import struct
+import threading
+import time
+
+import instrumentation
+
+FILE_MAGIC = b'UROCAP\x00\x01'
+RECORD = struct.Struct('<dII')
+
+# Capture levels
+CAPTURE_OFF = 0       # nothing is recorded
+CAPTURE_SUMMARY = 1   # timestamp + length only
+CAPTURE_FULL = 2      # timestamp + length + raw bytes
+CAPTURE_VERBOSE = 3   # CAPTURE_FULL plus a one-line stdout summary
+
+_STOP = object()
+
+
+class CaptureWriter:
+    """Background writer for raw payload capture files."""
+
+    def __init__(self, path='~/uro_tcp_debug.cap', level=CAPTURE_FULL,
+                 max_bytes=8 * 1024 * 1024, backup_count=3, queue_size=256):
+        # max_bytes=0 disables rotation; queue_size=0 means an unbounded
+        # queue (never drops, used for session recordings)
+        self.path = os.path.expanduser(path)
+        self.level = level
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._closed = False
+        self._lock = threading.Lock()
+        self.dropped = 0
+        self.written = 0
+        self.errors = 0   # failed record writes / rotations
+
+    def write(self, data):
+        """Queue one payload for capture. Never blocks."""
+        level = self.level
+        if level <= CAPTURE_OFF or not data:
+            return
+        if self._thread is None and not self._start():
+            # closed: the writer thread is gone and must not be restarted
+            self.dropped += 1
+            instrumentation.count('capture_dropped')
+            return
+        try:
+            # copy: callers may pass views into reused receive buffers
+            self._queue.put_nowait((time.time(), bytes(data) if level >= CAPTURE_FULL else len(data)))
+        except queue.Full:
+            self.dropped += 1
+            instrumentation.count('capture_dropped')
+
+    def _start(self):
+        """Start the writer thread once; False if the writer is closed."""
+        with self._lock:
+            if self._closed:
+                return False
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='uro-tcp-capture', daemon=True)
+                self._thread.start()
+            return True
+
+    def close(self, timeout=2.0):
+        """Flush queued records and stop the writer thread.
+
+        Waits up to ``timeout`` seconds; with ``timeout=0`` the thread
+        finishes writing in the background. Later writes are dropped.
+        """
+        with self._lock:
+            self._closed = True
+            thread = self._thread
+        if thread is None:
+            return
+        self._queue.put(_STOP)
+        thread.join(timeout)
+        self._thread = None
+
+    def _open(self):
+        exists = os.path.exists(self.path) and os.path.getsize(self.path) > 0
+        f = open(self.path, 'ab')
+        if not exists:
+            f.write(FILE_MAGIC)
+        return f
+
+    def _rotate(self, f):
+        f.close()
+        for i in range(self.backup_count - 1, 0, -1):
+            src = f"{self.path}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{i + 1}")
+        if self.backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        return self._open()
+
+    def _run(self):
+        try:
+            f = self._open()
+        except OSError as e:
+            print(f"[TCP DEBUG] capture disabled, cannot open {self.path}: {e}")
+            self.level = CAPTURE_OFF
+            return
+        try:
+            while True:
+                item = self._queue.get()
+                if item is _STOP:
+                    break
+                ts, payload = item
+                try:
+                    f = self._write_record(f, ts, payload)
+                except OSError as e:
+                    # a full disk or a failed rotation costs this record, not the writer
+                    self.errors += 1
+                    instrumentation.count('capture_errors')
+                    print(f"[TCP DEBUG] capture write failed: {e}")
+                    if f.closed:
+                        try:
+                            f = self._open()
+                        except OSError as e:
+                            print(f"[TCP DEBUG] capture disabled, cannot reopen {self.path}: {e}")
+                            self.level = CAPTURE_OFF
+                            break
+        finally:
+            f.close()
+
+    def _write_record(self, f, ts, payload):
+        if isinstance(payload, int):
+            # queued at CAPTURE_SUMMARY (the level may have changed since)
+            f.write(RECORD.pack(ts, payload, 0))
+            length = payload
+        else:
+            length = len(payload)
+            f.write(RECORD.pack(ts, length, length))
+            f.write(payload)
+        self.written += 1
+        if self.level >= CAPTURE_VERBOSE:
+            head = payload[:16].hex() if isinstance(payload, bytes) else ''
+            print(f"[TCP DEBUG] {length} bytes, head={head}")
+        # flush when the burst is over so a crash loses little
+        if self._queue.empty():
+            f.flush()
+        if self.max_bytes and f.tell() >= self.max_bytes:
+            f = self._rotate(f)
+        return f
+
+
+def iter_records(buf):
+    """Yield ``(timestamp, length, payload)`` from a capture file's bytes.
+
+    ``buf`` may be any buffer (bytes, mmap); payloads are zero-copy
+    memoryview slices of it.
+    """
+    mv = memoryview(buf)
+    if bytes(mv[:len(FILE_MAGIC)]) != FILE_MAGIC:
+        raise ValueError('not a capture file')
+    pos = len(FILE_MAGIC)
+    end = len(mv)
+    while pos + RECORD.size <= end:
+        ts, length, stored = RECORD.unpack_from(mv, pos)
+        pos += RECORD.size
+        if pos + stored > end:
+            # truncated tail (writer crashed mid-record)
+            break
+        yield ts, length, mv[pos:pos + stored]
+        pos += stored
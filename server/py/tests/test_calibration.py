@@ -0,0 +1,77 @@
+"""Tests for calibration tables as used by decode.StreamDecoder.
+
+A stream decoded chunk by chunk, cut at random byte offsets, must give the
+same flow as the whole stream; taring the scale mid-stream must not put a
+step in the flow::
+
+    python -m unittest discover -s server/py/tests
+"""
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+
+from calibration import Calibration  # noqa: E402
+from decode import StreamDecoder  # noqa: E402
+from filters import make_filter  # noqa: E402
+
+DT = 0.1
+POINTS = [(0, 0), (600, 480), (1200, 1000)]
+
+
+def _decoder(calibration, raw_filter=None):
+    return StreamDecoder(DT, 0, 1000, raw_filter=make_filter(raw_filter), calibration=calibration)
+
+
+def _ramp(start, step, n):
+    """Raw readings rising by ``step`` counts per sample."""
+    return (start + step * np.arange(n)).astype('<u2')
+
+
+class StreamCalibrationTest(unittest.TestCase):
+
+    def test_random_byte_splits(self):
+        rng = random.Random(23)
+        raw = _ramp(40, 3, 500) + np.array([rng.randrange(4) for _ in range(500)], dtype='<u2')
+        data = raw.tobytes()
+        for spec in (None, 'median:5+mean:3'):
+            times, flows = _decoder(Calibration(points=POINTS, tare=40), spec).feed(data)
+            self.assertEqual(len(flows), len(raw))
+            for _ in range(20):
+                cuts = sorted(rng.sample(range(1, len(data)), rng.randint(1, 60)))
+                dec = _decoder(Calibration(points=POINTS, tare=40), spec)
+                out = [dec.feed(data[a:b]) for a, b in zip([0] + cuts, cuts + [len(data)])]
+                with self.subTest(spec=spec, cuts=len(cuts)):
+                    np.testing.assert_array_equal(np.concatenate([t for t, _ in out]), times)
+                    np.testing.assert_allclose(np.concatenate([q for _, q in out]), flows, rtol=1e-12)
+
+    def test_no_step_across_a_tare(self):
+        # 6 counts per sample at 1.2 counts/mL is 5 mL per 0.1 s
+        raw = _ramp(300, 6, 200)
+        cal = Calibration.linear()
+        dec = _decoder(cal)
+        _, before = dec.feed_raw(raw[:120])
+        cal.set_tare(raw[119])
+        _, after = dec.feed_raw(raw[120:])
+        np.testing.assert_allclose(before[1:], 50.0)
+        np.testing.assert_allclose(after, 50.0)
+
+    def test_tare_with_piecewise_points(self):
+        # net counts stay inside the first segment, so flow is constant
+        raw = _ramp(1000, 6, 90)
+        cal = Calibration(points=POINTS, tare=1000)
+        dec = _decoder(cal)
+        flows = [dec.feed_raw(raw[:30])[1]]
+        cal.set_tare(raw[29])
+        flows.append(dec.feed_raw(raw[30:60])[1])
+        cal.set_tare(raw[59] - 60)
+        flows.append(dec.feed_raw(raw[60:])[1])
+        np.testing.assert_allclose(np.concatenate(flows)[1:], 6 * 0.8 / DT)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+"""Tests for decimate.Decimator: the incremental cache must always give
+the same samples as a fresh one-shot `decimate` call::
+
+    python -m unittest discover -s server/py/tests
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+
+from decimate import Decimator, decimate  # noqa: E402
+from ringbuffer import SampleRing  # noqa: E402
+
+DT = 0.01
+COLUMNS = 100
+
+
+def _void(n, peak_at, qmax):
+    """A high-rate void ending at 0 mL/s with its peak at sample ``peak_at``."""
+    xs = np.arange(1, n + 1) * DT
+    ys = np.clip(qmax - np.abs(np.arange(n) - peak_at) * 0.01, 0.0, None)
+    ys[-50:] = 0.0
+    return xs, ys
+
+
+class DecimatorTest(unittest.TestCase):
+
+    def test_growing_session_matches_one_shot(self):
+        xs, ys = _void(20000, 7000, 30.0)
+        dec = Decimator()
+        for n in range(500, len(xs) + 1, 1733):
+            got = dec.update(xs[:n], ys[:n], 0.0, xs[-1], COLUMNS)
+            want = decimate(xs[:n], ys[:n], 0.0, xs[-1], COLUMNS)
+            np.testing.assert_array_equal(got[0], want[0])
+            np.testing.assert_array_equal(got[1], want[1])
+
+    def test_new_session_of_same_length_keeps_its_peak(self):
+        # same length, same first/last time and last flow: only the
+        # ring's generation tells the two sessions apart
+        ring = SampleRing(20000)
+        dec = Decimator()
+        for peak_at, qmax in ((3000, 20.0), (15000, 35.0)):
+            ring.clear()
+            ring.extend(*_void(20000, peak_at, qmax))
+            xs, ys = dec.update(*ring.view(), 0.0, 200.0, COLUMNS, ring.generation)
+            self.assertEqual(ys.max(), qmax)
+            self.assertEqual(xs[np.argmax(ys)], (peak_at + 1) * DT)
+
+
+if __name__ == '__main__':
+    unittest.main()
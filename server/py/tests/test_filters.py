@@ -0,0 +1,67 @@
+"""Split tests for filters.py.
+
+A noisy recording is filtered whole and then chunk by chunk, cut at random
+offsets; the output must not depend on where the stream was split::
+
+    python -m unittest discover -s server/py/tests
+"""
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+
+from filters import make_filter  # noqa: E402
+
+SPECS = ['mean:4', 'median:5', 'savgol:9:2', 'median:5+mean:3', 'mean:1']
+
+
+def _readings(rng, n=300):
+    """Cumulative volume readings: a ramp with HX711-like noise and spikes."""
+    x = np.cumsum([max(0.0, rng.gauss(1.0, 0.5)) for _ in range(n)])
+    for i in rng.sample(range(n), 5):
+        x[i] += rng.choice((-40.0, 40.0))
+    return x
+
+
+def _filter(spec, parts):
+    f = make_filter(spec)
+    return np.concatenate([f.process(p) for p in parts])
+
+
+class FilterSplitTest(unittest.TestCase):
+
+    def test_random_splits(self):
+        rng = random.Random(16)
+        raw = _readings(rng)
+        for spec in SPECS:
+            whole = _filter(spec, [raw])
+            self.assertEqual(whole.dtype, np.float64)
+            self.assertEqual(len(whole), len(raw))
+            for _ in range(30):
+                cuts = sorted(rng.sample(range(1, len(raw)), rng.randint(1, 40)))
+                parts = [raw[a:b] for a, b in zip([0] + cuts, cuts + [len(raw)])]
+                with self.subTest(spec=spec, cuts=len(cuts)):
+                    np.testing.assert_allclose(_filter(spec, parts), whole, rtol=1e-12)
+
+    def test_sample_by_sample(self):
+        raw = _readings(random.Random(3))
+        for spec in SPECS:
+            with self.subTest(spec=spec):
+                np.testing.assert_allclose(_filter(spec, [raw[i:i + 1] for i in range(len(raw))]),
+                                           _filter(spec, [raw]), rtol=1e-12)
+
+    def test_reset_starts_a_new_stream(self):
+        raw = _readings(random.Random(4))
+        f = make_filter('median:5+mean:3')
+        first = f.process(raw)
+        f.process(raw[::-1])
+        f.reset()
+        np.testing.assert_array_equal(f.process(raw), first)
+
+
+if __name__ == '__main__':
+    unittest.main()
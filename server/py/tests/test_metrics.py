@@ -0,0 +1,65 @@
+"""Split tests for metrics.FlowMetrics.
+
+A void is folded in whole and then in chunks of every size; the running
+parameters must not depend on how the samples were chunked::
+
+    python -m unittest discover -s server/py/tests
+"""
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+
+from metrics import FlowMetrics, compute_metrics  # noqa: E402
+
+
+def _void(rng, n=400, dt=0.1):
+    """An interrupted void with sub-threshold noise before, between and after."""
+    t = np.arange(n) * dt
+    q = np.array([rng.uniform(0.0, 0.4) for _ in range(n)])
+    q[40:180] += 12.0 * np.sin(np.linspace(0.0, np.pi, 140))
+    q[220:330] += 20.0 * np.sin(np.linspace(0.0, np.pi, 110))
+    return t, q
+
+
+def _chunked(t, q, sizes):
+    m = FlowMetrics()
+    pos = 0
+    for size in sizes:
+        m.update(t[pos:pos + size], q[pos:pos + size])
+        pos += size
+    m.update(t[pos:], q[pos:])
+    return m
+
+
+class FlowMetricsSplitTest(unittest.TestCase):
+
+    def setUp(self):
+        self.t, self.q = _void(random.Random(15))
+
+    def assertSameMetrics(self, m, whole):
+        self.assertEqual(m.samples, len(self.t))
+        np.testing.assert_allclose(m.snapshot(), whole, rtol=1e-12, atol=1e-12)
+
+    def test_fixed_chunks(self):
+        whole = compute_metrics(self.t, self.q)
+        self.assertGreater(whole.qmax, 20.0)
+        for size in (1, 7):
+            with self.subTest(size=size):
+                m = _chunked(self.t, self.q, [size] * (len(self.t) // size))
+                self.assertSameMetrics(m, whole)
+
+    def test_random_chunks(self):
+        rng = random.Random(16)
+        whole = compute_metrics(self.t, self.q)
+        for _ in range(50):
+            sizes = [rng.randrange(0, 30) for _ in range(40)]
+            self.assertSameMetrics(_chunked(self.t, self.q, sizes), whole)
+
+
+if __name__ == '__main__':
+    unittest.main()
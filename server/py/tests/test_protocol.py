@@ -0,0 +1,96 @@
+"""Split-fuzz tests for protocol.FrameDecoder.
+
+A stream of frames mixed with garbage is fed whole and then cut at random
+offsets; the delivered frames and the counters must not depend on where
+the TCP reads split it::
+
+    python -m unittest discover -s server/py/tests
+"""
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from protocol import MAGIC, TYPE_END, FrameDecoder, encode_frame  # noqa: E402
+
+COUNTERS = ('frames', 'dropped', 'reordered', 'crc_errors', 'skipped_bytes')
+
+
+def _stream(rng, n_frames=20):
+    """Frames with garbage, corrupt frames and bad-version magics in between."""
+    parts, expected = [], []
+    for seq in range(n_frames):
+        samples = [rng.randrange(1 << 16) for _ in range(rng.randrange(0, 40))]
+        frame = encode_frame(seq, samples, timestamp_ms=seq * 100)
+        kind = rng.random()
+        if kind < 0.15:
+            # a stray magic with an unknown version right before the frame
+            parts.append(MAGIC + bytes([9]) + bytes(rng.randrange(256) for _ in range(3)))
+        elif kind < 0.25:
+            parts.append(bytes(rng.randrange(256) for _ in range(rng.randrange(1, 30))))
+        elif kind < 0.3 and samples:
+            bad = bytearray(frame)
+            bad[-1] ^= 0xFF
+            parts.append(bytes(bad))
+            continue
+        parts.append(frame)
+        expected.append((seq, samples))
+    parts.append(encode_frame(n_frames, frame_type=TYPE_END))
+    expected.append((n_frames, []))
+    return b''.join(parts), expected
+
+
+def _decode(parts):
+    dec = FrameDecoder(max_samples=64)
+    frames = [(f.seq, f.samples.tolist()) for p in parts for f in dec.feed(p)]
+    return frames, {c: getattr(dec, c) for c in COUNTERS}
+
+
+class FrameDecoderSplitTest(unittest.TestCase):
+
+    def test_random_splits(self):
+        rng = random.Random(8)
+        for _ in range(20):
+            data, expected = _stream(rng)
+            whole, counters = _decode([data])
+            self.assertEqual(whole, expected)
+            for _ in range(30):
+                cuts = sorted(rng.sample(range(1, len(data)), rng.randint(1, 40)))
+                parts = [data[a:b] for a, b in zip([0] + cuts, cuts + [len(data)])]
+                self.assertEqual(_decode(parts), (whole, counters))
+
+    def test_byte_by_byte(self):
+        data, expected = _stream(random.Random(3))
+        whole = _decode([data])
+        self.assertEqual(_decode([data[i:i + 1] for i in range(len(data))]), whole)
+
+    def test_bad_version_rescans_the_header(self):
+        frame = encode_frame(0, [1, 2, 3])
+        frames, counters = _decode([MAGIC + b'\x09' + frame])
+        self.assertEqual(frames, [(0, [1, 2, 3])])
+        self.assertEqual(counters['skipped_bytes'], 3)
+
+    def test_crc_failure_rescans_after_the_magic(self):
+        # a false header whose count swallows the following frames
+        good = [encode_frame(seq, [seq] * 4) for seq in range(3)]
+        fake = bytearray(encode_frame(9, [0] * 30))[:18]
+        data = bytes(fake[:-1]) + bytes([fake[-1] ^ 0xFF]) + b''.join(good)
+        for parts in ([data], [data[i:i + 5] for i in range(0, len(data), 5)]):
+            frames, counters = _decode(parts)
+            self.assertEqual(frames, [(seq, [seq] * 4) for seq in range(3)])
+            self.assertEqual(counters['crc_errors'], 1)
+            self.assertEqual(counters['skipped_bytes'], 18)
+
+    def test_oversized_count_is_rejected(self):
+        head = bytearray(encode_frame(0, [0] * 65)[:18])
+        data = bytes(head) + encode_frame(0, [7, 8]) + encode_frame(1, frame_type=TYPE_END)
+        frames, counters = _decode([data])
+        self.assertEqual(frames, [(0, [7, 8]), (1, [])])
+        self.assertEqual(counters['skipped_bytes'], 18)
+        self.assertEqual(counters['crc_errors'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
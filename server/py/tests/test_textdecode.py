@@ -0,0 +1,104 @@
+"""Split-fuzz tests for textdecode.TextDecoder.
+
+Every payload is fed whole and then cut at random offsets; the decoded
+values must not depend on where the TCP reads split it::
+
+    python -m unittest discover -s server/py/tests
+"""
+import json
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+
+from textdecode import TextDecoder, decode_text  # noqa: E402
+
+PAYLOADS = [
+    (b'[1.5, 2.0, 2.5][3.0]', [1.5, 2.0, 2.5, 3.0]),
+    (b'{"flows": [1.5, 2.0]}{"flow": 2.5}\n', [1.5, 2.0, 2.5]),
+    (b'1.5\n2.0\n2.5\n', [1.5, 2.0, 2.5]),
+    (b'{1.5, 2.0, 2.5}\n{3.0}', [1.5, 2.0, 2.5, 3.0]),
+    (b'{"samples":[1,2,3],"meta":{"id":3}}\n{"samples":[4],"meta":{"note":"}"}}\n',
+     [1.0, 2.0, 3.0, 4.0]),
+    (b'{"flow": 1.0, "meta": {"a": {"b": "{}"}}}{5, 6}[7]', [1.0, 5.0, 6.0, 7.0]),
+    (b'{"note": "a\\"}b\\\\", "flow": 9}\n{"note": "\\\\{", "flows": [8]}', [9.0, 8.0]),
+]
+
+
+def _split(data, rng, pieces):
+    cuts = sorted(rng.sample(range(1, len(data)), min(pieces, len(data) - 1)))
+    return [data[a:b] for a, b in zip([0] + cuts, cuts + [len(data)])]
+
+
+def _feed_all(parts, column=None):
+    dec = TextDecoder(column)
+    out = [dec.feed(p) for p in parts]
+    out.append(dec.finish())
+    return np.concatenate(out), dec.errors
+
+
+class TextDecoderSplitTest(unittest.TestCase):
+
+    def test_whole_payloads(self):
+        for data, expected in PAYLOADS:
+            with self.subTest(data=data):
+                np.testing.assert_array_equal(decode_text(data), expected)
+
+    def test_random_splits(self):
+        rng = random.Random(21)
+        for data, expected in PAYLOADS:
+            for _ in range(200):
+                parts = _split(data, rng, rng.randint(1, 12))
+                with self.subTest(data=data, parts=parts):
+                    values, errors = _feed_all(parts)
+                    np.testing.assert_array_equal(values, expected)
+                    self.assertEqual(errors, 0)
+
+    def test_every_single_cut(self):
+        data, expected = PAYLOADS[4]
+        for cut in range(1, len(data)):
+            with self.subTest(cut=cut):
+                values, _ = _feed_all([data[:cut], data[cut:]])
+                np.testing.assert_array_equal(values, expected)
+
+    def test_every_single_cut_with_escapes(self):
+        data, expected = PAYLOADS[6]
+        for cut in range(1, len(data)):
+            with self.subTest(cut=cut):
+                values, errors = _feed_all([data[:cut], data[cut:]])
+                np.testing.assert_array_equal(values, expected)
+                self.assertEqual(errors, 0)
+
+    def test_large_object_in_small_reads(self):
+        data = json.dumps({'meta': {'id': 1}, 'samples': list(range(20000))}).encode()
+        parts = [data[i:i + 7] for i in range(0, len(data), 7)]
+        values, errors = _feed_all(parts)
+        np.testing.assert_array_equal(values, np.arange(20000))
+        self.assertEqual(errors, 0)
+
+    def test_unclosed_object_is_dropped(self):
+        dec = TextDecoder(max_pending=64)
+        out = [dec.feed(b'{"samples": [' + b'1, ' * 10), dec.feed(b'2, ' * 30 + b'\n3\n')]
+        out.append(dec.finish())
+        np.testing.assert_array_equal(np.concatenate(out), [3.0])
+        self.assertEqual(dec.errors, 1)
+
+    def test_csv_column_splits(self):
+        data = b'0.3,1.5\n0.6,2.0\n0.9,2.5'
+        rng = random.Random(7)
+        for _ in range(100):
+            values, _ = _feed_all(_split(data, rng, rng.randint(1, 6)), column=-1)
+            np.testing.assert_array_equal(values, [1.5, 2.0, 2.5])
+
+    def test_malformed_object_is_skipped(self):
+        values, errors = _feed_all([b'{"flow": }', b'[1, 2]'])
+        np.testing.assert_array_equal(values, [1.0, 2.0])
+        self.assertEqual(errors, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,292 @@
+"""Incremental decoder for text device output (JSON / NDJSON / CSV).
+
+Some firmware builds and third-party sensors send flow values as text
+instead of uint16 batches. ``TextDecoder.feed`` accepts the bytes of each
+TCP read and returns the values completed so far as a float64 array. A
+message may be split across reads, and one read may hold many messages.
+The following all decode to the same values::
+
+    [1.5, 2.0, 2.5]                      JSON array(s), concatenated or not
+    {"flows": [1.5, 2.0]}{"flow": 2.5}   JSON objects / NDJSON lines
+    1.5\\n2.0\\n2.5\\n                      one value per line
+    0.3,1.5\\n0.6,2.0\\n                   CSV rows (``column`` picks a field)
+    {1.5, 2.0, 2.5}                      Python set repr (older firmware)
+
+Complete runs of numbers are converted in one vectorized step, and objects
+are parsed with ``json.JSONDecoder.raw_decode`` at their start offset. An
+object split across reads is kept as a list of pieces while a brace scanner
+follows it (only the new text of each read is scanned), and is parsed once
+when its closing brace arrives. Only an unfinished number or row is carried
+over and read again with the next read.
+"""
+import codecs
+import json
+import re
+
+import numpy as np
+
+# keys holding a list of values / a single value in JSON objects
+LIST_KEYS = ('samples', 'flow_rates', 'flows', 'data')
+VALUE_KEYS = ('flow_rate', 'flow', 'value')
+
+_SEPARATORS = str.maketrans({',': ' ', ';': ' ', '\t': ' ', '\r': ' ', '\n': ' '})
+_decoder = json.JSONDecoder()
+_OBJECT_TOKENS = re.compile(r'[{}"\\]')
+_SCAN_START = (0, False, False)   # brace depth, inside a string, after a backslash
+
+
+def looks_like_text(data):
+    """True if ``data`` is printable ASCII starting like a text message.
+
+    uint16 load-cell batches always contain control bytes (the high byte of
+    every reading below 8192), so they are not mistaken for text.
+    """
+    head = bytes(data[:256])
+    stripped = head.lstrip()
+    if not stripped or stripped[:1] not in b'[{+-.0123456789':
+        return False
+    return all(32 <= b < 127 or b in b'\t\r\n' for b in head)
+
+
+def _to_floats(tokens):
+    if not tokens:
+        return None
+    try:
+        return np.array(tokens, dtype=np.float64)
+    except (TypeError, ValueError):
+        # a header or a stray word: keep what parses
+        out = []
+        for tok in tokens:
+            try:
+                out.append(float(tok))
+            except (TypeError, ValueError):
+                pass
+        return np.array(out, dtype=np.float64) if out else None
+
+
+def _object_end(text, pos, state=_SCAN_START):
+    """Scan ``text[pos:]`` for the ``}`` closing an object.
+
+    Returns ``(index just past it, None)``, or ``(-1, state)`` when the
+    object continues past the end of ``text``; pass that state back in with
+    the next text. Braces inside JSON strings are skipped, so a split nested
+    object is not cut short at its first inner ``}``.
+    """
+    depth, in_string, escaped = state
+    i = pos + 1 if escaped else pos
+    end = len(text)
+    while True:
+        m = _OBJECT_TOKENS.search(text, i)
+        if m is None:
+            return -1, (depth, in_string, False)
+        ch = m.group()
+        i = m.end()
+        if in_string:
+            if ch == '\\':
+                if i >= end:
+                    return -1, (depth, True, True)
+                i += 1
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch == '{':
+            depth += 1
+        elif ch == '}':
+            depth -= 1
+            if depth == 0:
+                return i, None
+
+
+class TextDecoder:
+    """Stateful text-to-values decoder; see the module docstring.
+
+    ``column`` selects one field of multi-field CSV rows (e.g. ``-1`` for
+    ``time,flow`` rows); by default every number is a value. A pending
+    message longer than ``max_pending`` characters is dropped as garbage.
+    """
+
+    def __init__(self, column=None, max_pending=1 << 20):
+        self.column = column
+        self.max_pending = max_pending
+        self.values = 0
+        self.errors = 0
+        self.reset()
+
+    def reset(self):
+        self._utf8 = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self._tail = ''
+        self._depth = 0   # > 0 while inside a JSON array
+        self._object = None   # pieces of an object waiting for its closing brace
+        self._object_len = 0
+        self._scan = _SCAN_START
+
+    def feed(self, data):
+        """Decode one read; returns the newly completed values."""
+        text = self._utf8.decode(bytes(data))
+        chunks, scalars = [], []
+        if self._object is not None:
+            text = self._continue_object(chunks, scalars, text, final=False)
+        return self._parse(self._tail + text, False, chunks, scalars)
+
+    def finish(self):
+        """End of stream: decode whatever is left (a last unterminated row)."""
+        text = self._utf8.decode(b'', final=True)
+        chunks, scalars = [], []
+        if self._object is not None:
+            text = self._continue_object(chunks, scalars, text, final=True)
+        out = self._parse(self._tail + text, True, chunks, scalars)
+        self.reset()
+        return out
+
+    def _continue_object(self, chunks, scalars, text, final):
+        """Feed ``text`` to the pending object; returns the text after it."""
+        close, self._scan = _object_end(text, 0, self._scan)
+        if close < 0:
+            self._object.append(text)
+            self._object_len += len(text)
+            if not final and self._object_len <= self.max_pending:
+                return ''
+            # never closed: drop it up to the end of its line
+            self.errors += 1
+            text = ''.join(self._object)
+            self._object = None
+            self._scan = _SCAN_START
+            nl = text.find('\n')
+            return '' if nl < 0 else text[nl + 1:]
+        self._object.append(text[:close])
+        body = ''.join(self._object)
+        self._object = None
+        try:
+            obj = json.loads(body)
+        except json.JSONDecodeError:
+            self._add_unparsed(chunks, scalars, body)
+        else:
+            self._add_object(chunks, scalars, obj)
+        return text[close:]
+
+    def _parse(self, text, final, chunks, scalars):
+        # scalars: single values from objects, converted in one go
+        pos = 0
+        end = len(text)
+        while pos < end:
+            # skip separators between messages / array items
+            while pos < end and text[pos] in ' \t\r\n,;':
+                pos += 1
+            if pos >= end:
+                break
+            ch = text[pos]
+            if ch == '{':
+                try:
+                    obj, stop = _decoder.raw_decode(text, pos)
+                except json.JSONDecodeError:
+                    close, scan = _object_end(text, pos)
+                    if close >= 0:
+                        self._add_unparsed(chunks, scalars, text[pos:close])
+                        pos = close
+                        continue
+                    if final or end - pos > self.max_pending:
+                        self.errors += 1
+                        nl = text.find('\n', pos)
+                        pos = end if nl < 0 else nl + 1
+                        continue
+                    # wait for the rest of the object; later reads only
+                    # scan their own text for its closing brace
+                    self._object = [text[pos:]]
+                    self._object_len = end - pos
+                    self._scan = scan
+                    pos = end
+                    break
+                self._add_object(chunks, scalars, obj)
+                pos = stop
+            elif ch == '[':
+                self._depth += 1
+                pos += 1
+            elif ch == ']':
+                self._depth = max(0, self._depth - 1)
+                pos += 1
+            elif self._depth:
+                # numbers inside an array: up to the next object / bracket
+                stop = min(i for i in (text.find('{', pos), text.find('[', pos),
+                                       text.find(']', pos), end) if i >= 0)
+                if stop == end and not final:
+                    # the last token may continue in the next read
+                    cut = max(text.rfind(c, pos, end) for c in ', \t\r\n')
+                    if cut < pos:
+                        break
+                    stop = cut + 1
+                self._add(chunks, scalars, _to_floats(text[pos:stop].translate(_SEPARATORS).split()))
+                pos = stop
+            else:
+                # CSV / plain lines: all complete rows up to the next object
+                stop = text.find('{', pos)
+                stop = end if stop < 0 else stop
+                nl = text.rfind('\n', pos, stop)
+                if nl < 0:
+                    if not final and stop == end:
+                        break  # wait for the end of the row
+                    nl = stop - 1
+                self._add(chunks, scalars, self._rows(text[pos:nl + 1]))
+                pos = nl + 1
+        self._tail = text[pos:]
+        if len(self._tail) > self.max_pending:
+            self.errors += 1
+            self._tail = ''
+        self._flush(chunks, scalars)
+        if not chunks:
+            return np.empty(0)
+        out = chunks[0] if len(chunks) == 1 else np.concatenate(chunks)
+        self.values += len(out)
+        return out
+
+    def _add(self, chunks, scalars, values):
+        if values is not None and len(values):
+            self._flush(chunks, scalars)
+            chunks.append(values)
+
+    def _flush(self, chunks, scalars):
+        if scalars:
+            values = _to_floats(scalars)
+            if values is not None:
+                chunks.append(values)
+            scalars.clear()
+
+    def _rows(self, block):
+        if self.column is None:
+            return _to_floats(block.translate(_SEPARATORS).split())
+        rows = [line.replace(';', ',').replace('\t', ',').split(',')
+                for line in block.splitlines() if line.strip()]
+        picked = []
+        for row in rows:
+            try:
+                picked.append(row[self.column])
+            except IndexError:
+                self.errors += 1
+        return _to_floats([p.strip() for p in picked])
+
+    def _add_unparsed(self, chunks, scalars, body):
+        """A complete ``{...}`` that is not JSON."""
+        inner = body[1:-1]
+        if '"' not in inner and ':' not in inner:
+            # e.g. a Python set repr '{5, 7, 8}'
+            self._add(chunks, scalars, _to_floats(inner.translate(_SEPARATORS).split()))
+        else:
+            self.errors += 1   # malformed JSON
+
+    def _add_object(self, chunks, scalars, obj):
+        for k in VALUE_KEYS:
+            if k in obj:
+                scalars.append(obj[k])
+                return
+        for k in LIST_KEYS:
+            if isinstance(obj.get(k), list):
+                self._add(chunks, scalars, _to_floats(obj[k]))
+                return
+
+
+def decode_text(data, column=None):
+    """Decode a complete text payload; returns a float64 array."""
+    dec = TextDecoder(column)
+    values = dec.feed(data)
+    rest = dec.finish()
+    return np.concatenate((values, rest)) if len(rest) else values
@@ -1,23 +1,32 @@
-import socket
-import json
-import re
+import queue
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
-import subprocess
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-from matplotlib.figure import Figure
-# Data storage: use in-memory structures only (no persistent DB)
-# Data storage: use in-memory structures only (no persistent DB)
+# Data storage: finished and in-progress tests are kept in the session
+# store (sessionstore.py); live_samples only holds the test on screen
 import time
 from datetime import datetime
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak, Image
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-import numpy as np
-import tempfile
+import functools
+import importlib
 import os
-from matplotlib.backends.backend_agg import FigureCanvasAgg
+import threading
+import instrumentation
+from redraw import RedrawScheduler
+from tcpcapture import CaptureWriter, CAPTURE_FULL
+
+# numpy, matplotlib and reportlab are not imported at module load so the
+# window appears quickly; these modules are imported by a warm-up thread
+# once the first frame is shown (or on first use, whichever comes first).
+WARM_UP_MODULES = ('ringbuffer', 'metrics', 'liveplot', 'acquisition', 'replay', 'sessionstore',
+                   'reporting')
+
+
+def _warm_up(modules=WARM_UP_MODULES):
+    for name in modules:
+        try:
+            importlib.import_module(name)
+        except Exception as e:
+            print(f"[STARTUP] warm-up import of {name} failed: {e}")
+
 
 class UroflowmetryApp:
     def __init__(self, root):
@@ -26,26 +35,80 @@ class UroflowmetryApp:
         self.root.geometry("480x320")
         # self.root.attributes('-fullscreen', True)
         # Apply styles before creating widgets so themed widgets use them
-        # Initialize session state (no persistent DB)
-        # keep only live-sample and UI-related state here
+        # Initialize session state; tests are persisted by the session store
         self.server_port = 0
         self.device_connected = False
-        self.live_samples = []
         self.sample_interval = 0.3
-        self._last_live_len = 0
-        # Note: connector thread removed — connect_device will read one batch
-        # of samples and populate `self.live_samples` for a single-shot plot.
+        self.max_plot_fps = 10
+        # Raw TCP payload capture (binary, rotated, written off-thread).
+        # Set `tcp_capture.level` to CAPTURE_OFF/SUMMARY/FULL/VERBOSE.
+        self.tcp_capture = CaptureWriter('~/uro_tcp_debug.cap', level=CAPTURE_FULL)
+        # Every device session is also recorded for replay (see replay.py)
+        self.record_sessions = True
+        self.session_dir = os.path.expanduser('~/uro_sessions')
+        self.session_recorder = None
+        # Decoded samples and metrics of every test go to the session store
+        # (SQLite index + sample columns), opened on the first test
+        self.store_sessions = True
+        self.store_dir = os.path.expanduser('~/uro_store')
+        self.session_store = None
+        self.session_writer = None
+        # Reports render in a worker process and print via a background
+        # queue; status updates arrive on `report_events` (see reporting.py)
+        self.report_service = None
+        self.report_events = queue.Queue()
+        self._reports_open = 0
+        # Acquisition mode: single-shot batch (default firmware behaviour) or
+        # a streaming session where chunks are plotted as they arrive.
+        self.stream_mode = False
+        # Streaming firmware that speaks the framed protocol (protocol.py)
+        self.framed_protocol = False
+        # Raw-reading smoothing applied before flow is derived (filters.py
+        # spec, e.g. 'median:5', 'savgol:9:2'; None disables it)
+        self.raw_filter = 'median:5'
+        # Per-device load-cell calibrations (calibration.py); the connected
+        # device's calibration is loaded on the first test and can be tared
+        # live with the Tare button
+        self.calibration_path = os.path.expanduser('~/uro_calibration.json')
+        self.calibration = None
+        # Running clinical parameters (metrics.FlowMetrics), created with the
+        # sample ring and updated per chunk as samples arrive
+        self.metrics = None
+        self._reset_running_stats()
+        # Device I/O runs on a background AcquisitionEngine; the Tk thread
+        # drains its queue every `acq_poll_ms` while a test is running.
+        self.acq_engine = None
+        self.acq_queue = None
+        self.acq_poll_ms = 100
+        # Instrumentation (instrumentation.py): receive stamp of the oldest
+        # undrawn samples, a failed test (next connect is a reconnect) and
+        # the optional on-screen overlay, toggled with F12
+        self._plot_received = None
+        self._last_test_failed = False
+        self.overlay_label = None
+        self.overlay_ms = 1000
         # Sampling: 400 samples at 300ms interval = 120 seconds total test time
         self.sample_interval = 0.3  # 300ms per sample
         self.graph_total_duration = 120.0  # 400 samples × 0.3s = 120s
+        # Live samples live in a fixed-capacity ring buffer sized to the test
+        # duration; plotting/reporting read zero-copy NumPy views from it.
+        # The ring and the live plot are created by `_finish_startup`.
+        self.live_samples = None
+        self.live_plot = None
+        self._warmup = None
         # Flowrate limits (units: mL/s). Y-axis range for flow rate graph
-        # Device mapping: raw 0 -> 0 mL, raw 1200 -> 1000 mL (linear)
+        # Raw reading -> mL mapping: see `self.calibration` (calibration.py)
         self.flowrate_min = 0.0
         self.flowrate_max = 50.0  # mL/s max on y-axis
         self.setup_styles()
         self.create_widgets()
+        # Start the warm-up once the window is mapped; the timer covers
+        # windows that are never mapped (withdrawn / headless use).
+        self.root.bind('<Map>', lambda e: self.root.after_idle(self._start_warm_up), add='+')
+        self.root.after(1000, self._start_warm_up)
+        self.root.bind('<F12>', lambda e: self.toggle_overlay())
 
-    # init_db removed — session state initialized in __init__ (no DB persistence)
+    # init_db removed — tests are persisted by sessionstore.SessionStore
 
     def setup_styles(self):
         """Configure a simple, colorful ttk style for the UI."""
@@ -116,155 +179,135 @@ class UroflowmetryApp:
         self.device_status = ttk.Label(frame, text='Device: Disconnected')
         self.device_status.pack(pady=6)
 
+        # Streaming mode: the device pushes samples as they are measured and
+        # the graph updates live instead of after the whole 120 s batch.
+        self.stream_var = tk.BooleanVar(master=self.root, value=self.stream_mode)
+        ttk.Checkbutton(frame, text='Live streaming', variable=self.stream_var).pack(pady=6)
+
+        # Zero the scale at the current reading of a running stream
+        ttk.Button(frame, text='Tare Scale', command=self.tare_scale).pack(pady=6)
+
     def create_test_tab(self):
         frame = ttk.LabelFrame(self.test_tab, text="Uroflowmetry Test", padding=10)
         frame.pack(fill='both', expand=True, padx=10, pady=10)
         # Note: patient selection and manual input fields removed
+        # Running Qmax / Qave / volume / flow times (updated as samples arrive)
+        self.stats_label = ttk.Label(frame, text='')
+        self.stats_label.pack(anchor='w', padx=5)
         # Graph canvas (show above the Generate button)
         self.canvas_frame = ttk.Frame(frame)
         self.canvas_frame.pack(fill='both', expand=True, padx=5, pady=5)
 
         # Generate report button (uses most recent patient if none selected elsewhere)
         ttk.Button(frame, text="Generate PDF Report", command=self.generate_pdf).pack(pady=5)
+        self.report_status = ttk.Label(frame, text='')
+        self.report_status.pack()
 
-        # Show live flow-vs-time plot on this tab. The live plot is updated when
-        # samples arrive, and a periodic refresh will redraw only when the
-        # sample buffer length changes to reduce CPU load.
-        try:
-            self.plot_live_samples()
-        except Exception:
-            pass
+        # Redraws are event driven: producers call `self.redraw.mark_dirty()`
+        # and bursts are coalesced to at most `max_plot_fps` frames/second.
+        self.redraw = RedrawScheduler(self.root, self.plot_live_samples, max_fps=self.max_plot_fps)
 
-        # periodic refresh (redraw only when samples changed)
-        try:
-            self.root.after(500, self._refresh_live_plot)
-        except Exception:
-            pass
+    def _start_warm_up(self):
+        """Import the heavy modules on a background thread (runs once)."""
+        if self._warmup is not None:
+            return
+        self._warmup = threading.Thread(target=_warm_up, name='uro-warm-up', daemon=True)
+        self._warmup.start()
+        self.root.after(50, self._poll_warm_up)
 
-    def _refresh_live_plot(self):
-        try:
-            if len(self.live_samples) != getattr(self, '_last_live_len', 0):
-                self._last_live_len = len(self.live_samples)
-                try:
-                    self.plot_live_samples()
-                except Exception:
-                    pass
-        except Exception:
-            pass
-        try:
-            self.root.after(500, self._refresh_live_plot)
-        except Exception:
-            pass
+    def _poll_warm_up(self):
+        if self._warmup.is_alive():
+            self.root.after(50, self._poll_warm_up)
+            return
+        self._finish_startup()
+
+    def _finish_startup(self):
+        """Create the sample ring and the live plot (Tk thread, idempotent).
+
+        Called when the warm-up thread is done, or earlier by anything that
+        needs them; imports still in flight on the warm-up thread are waited
+        for by the import lock.
+        """
+        if self.live_plot is not None:
+            return
+        from ringbuffer import SampleRing, capacity_for
+        from liveplot import LivePlot
+        from metrics import FlowMetrics
+        self.live_samples = SampleRing(capacity_for(self.graph_total_duration, self.sample_interval))
+        self.metrics = FlowMetrics()
+        # Show live flow-vs-time plot on the test tab. The figure and Tk widget
+        # are created once here; refreshes blit new data into the existing axes.
+        self.live_plot = LivePlot(
+            master=self.canvas_frame,
+            xlim=(0.0, float(self.graph_total_duration)),
+            ylim=(float(self.flowrate_min), float(self.flowrate_max)),
+        )
 
     def create_report_tab(self):
         # Deprecated: report controls moved to Test & Graph tab.
         pass
 
-    def _debug_log_tcp(self, data: bytes):
-        """Append a small debug record for raw TCP payloads.
+    def replay_session(self, path, speed=1.0):
+        """Replay a recorded session file at `speed` (0 = as fast as possible)."""
+        if getattr(self, 'acq_engine', None) is not None:
+            self.acq_engine.cancel()
+        self.device_connected = False
+        from replay import SessionReplay
+        self.connect_device(replay=SessionReplay(path), replay_speed=speed)
 
-        Writes a timestamped entry to ~/uro_tcp_debug.log and prints a
-        concise summary (hex prefix + safe-decoded text) to stdout.
+    def _on_device_payload(self, data: bytes, recorder=None):
+        """Raw payload hook (acquisition thread): debug capture + recording.
+
+        ``recorder`` is bound per test, so a cancelled engine that is still
+        winding down never writes into the next test's recording.
         """
-        try:
-            if not data:
-                return
-            # safe text representation
-            text = data.decode(errors='replace')
-            hexdump = data.hex()
-            # keep hex summary reasonably small
-            hex_summary = hexdump[:200]
-            log_path = os.path.expanduser('~/uro_tcp_debug.log')
-            timestamp = datetime.now().isoformat()
-            with open(log_path, 'ab') as f:
-                f.write(f"--- {timestamp} ---\n".encode('utf-8'))
-                f.write(data + b"\n")
-            # Prefer decimal output: if data looks like 16-bit samples, print
-            # them as unsigned decimals separated by a single space. Otherwise
-            # fall back to printing each byte as decimal separated by spaces.
-            try:
-                dec_str = None
-                # limit detailed decimal output length to avoid huge prints
-                max_dec_chars = 1000
-                if len(data) >= 2 and len(data) % 2 == 0 and len(data) <= 1600:
-                    import struct
-                    num = len(data) // 2
-                    vals = struct.unpack(f'<{num}H', data)
-                    dec_str = ' '.join(str(v) for v in vals)
-                else:
-                    dec_str = ' '.join(str(b) for b in data)
-                if len(dec_str) > max_dec_chars:
-                    print(f"[TCP DEBUG] {len(data)} bytes, decimal={dec_str[:max_dec_chars]}...")
-                else:
-                    print(f"[TCP DEBUG] {len(data)} bytes, decimal={dec_str}")
-            except Exception:
-                # fallback to hex/text if decimal formatting fails
-                print(f"[TCP DEBUG] {len(data)} bytes, hex={hex_summary}{'...' if len(hexdump)>200 else ''}")
-            print(f"[TCP TEXT] {text}")
-        except Exception as e:
-            print(f"[TCP DEBUG] logging failed: {e}")
+        self._debug_log_tcp(data)
+        if recorder is not None:
+            recorder.write(data)
 
+    def _debug_log_tcp(self, data: bytes):
+        """Hand a raw TCP payload to the background capture writer.
+
+        Runs on the acquisition thread; only a level check and a
+        non-blocking queue put happen here. Records are written to
+        ~/uro_tcp_debug.cap by the writer thread (see tcpcapture.py).
+        """
+        self.tcp_capture.write(data)
 
     # server queue and polling removed — live samples should be pushed directly
     # into `self.live_samples` by external code or device handlers.
 
     def plot_live_samples(self):
-        """Plot the current `self.live_samples` (time, flow) into `self.canvas_frame`.
+        """Show the current `self.live_samples` ring buffer on the live plot.
 
-        This renders a scrolling-style live plot of the most recent samples.
+        The plot is created once (see `create_test_tab`); refreshes only swap
+        the line/fill data and blit the axes region.
         """
-        # Ensure canvas_frame exists
-        if not hasattr(self, 'canvas_frame'):
+        plot = getattr(self, 'live_plot', None)
+        if plot is None:
             return
-
-        for w in self.canvas_frame.winfo_children():
-            w.destroy()
-
-        if not self.live_samples:
-            # Render an empty axes so the tab always shows a plot area
-            fig = Figure(figsize=(6, 3), dpi=100)
-            ax = fig.add_subplot(111)
-            ax.set_xlabel('Time (s)')
-            ax.set_ylabel('Flow Rate (mL/s)')
-            ax.set_title('Live Flow (stream) — no data')
-            ax.grid(True, alpha=0.3)
-            try:
-                ax.set_xlim(0.0, float(self.graph_total_duration))
-            except Exception:
-                pass
-            try:
-                ax.set_ylim(float(self.flowrate_min), float(self.flowrate_max))
-            except Exception:
-                pass
-
-            canvas = FigureCanvasTkAgg(fig, master=self.canvas_frame)
-            canvas.draw()
-            canvas.get_tk_widget().pack(fill='both', expand=True)
+        xs, ys = self.live_samples.view()
+        plot.update(xs, ys, self.live_samples.generation)
+        if self._plot_received is not None:
+            instrumentation.since('plot', self._plot_received)
+            self._plot_received = None
+
+    def toggle_overlay(self):
+        """Show/hide the instrumentation overlay (enables instrumentation)."""
+        if self.overlay_label is not None:
+            self.overlay_label.destroy()
+            self.overlay_label = None
             return
+        instrumentation.enable()
+        self.overlay_label = ttk.Label(self.stats_label.master, text='', font=('Segoe UI', 8))
+        self.overlay_label.pack(anchor='w', padx=5, after=self.stats_label)
+        self._refresh_overlay()
 
-        xs = [s[0] for s in self.live_samples]
-        ys = [s[1] for s in self.live_samples]
-
-        fig = Figure(figsize=(6, 3), dpi=100)
-        ax = fig.add_subplot(111)
-        ax.plot(xs, ys, color='#2a9df4', linewidth=1.5)
-        ax.fill_between(xs, ys, alpha=0.15, color='#2a9df4')
-        ax.set_xlabel('Time (s)')
-        ax.set_ylabel('Flow Rate (mL/s)')
-        ax.set_title('Live Flow (stream)')
-        ax.grid(True, alpha=0.3)
-        try:
-            ax.set_xlim(0.0, float(self.graph_total_duration))
-        except Exception:
-            pass
-        try:
-            ax.set_ylim(float(self.flowrate_min), float(self.flowrate_max))
-        except Exception:
-            pass
-
-        canvas = FigureCanvasTkAgg(fig, master=self.canvas_frame)
-        canvas.draw()
-        canvas.get_tk_widget().pack(fill='both', expand=True)
+    def _refresh_overlay(self):
+        if self.overlay_label is None:
+            return
+        self.overlay_label.config(text=instrumentation.summary_line())
+        self.root.after(self.overlay_ms, self._refresh_overlay)
 
     def get_patient_names(self):
         # patient list removed; provide empty list for compatibility
@@ -273,276 +316,358 @@ class UroflowmetryApp:
 
     # start_server/stop_server removed — server control handled externally if needed
 
-    def connect_device(self):
-        """Simple toggle for device connection state. This is a lightweight UI affordance
-        that can later be extended to perform device-specific handshake/initialisation.
-        """
-        host = '192.168.1.3'  # Server IP address
-        port = 4244        # Server port
+    def connect_device(self, replay=None, replay_speed=1.0):
+        """Toggle the device test. Connecting starts a background acquisition
+        engine which owns the socket; toggling again cancels a running test
+        (or clears the last result) without blocking the Tk event loop.
 
-        # For this build we perform a single-shot fetch of data from the device
-        # and render the plot for that batch only. Toggling the button will
-        # attempt to connect and read one block of samples.
+        ``replay`` (a `replay.SessionReplay`) feeds a recorded session through
+        the same pipeline instead of the device.
+        """
+        self._finish_startup()
         self.device_connected = not getattr(self, 'device_connected', False)
         if self.device_connected:
-            try:
-                with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                    s.connect((host, port))
-                    s.settimeout(300)  # 5 minutes timeout
-                    # Send command: 2 bytes 0x30 0x30
-                    try:
-                        s.send(b'\x30\x30')
-                        print("[TCP CMD] Sent command: 0x30 0x30")
-                    except Exception as e:
-                        print(f"[TCP CMD] Failed to send command: {e}")
-                    try:
-                        data = s.recv(65536)
-                        # Log raw TCP payload for debugging (hex + safe text)
-                        try:
-                            self._debug_log_tcp(data)
-                        except Exception:
-                            # fallback to simple print if helper fails
-                            print(f"Received data (raw): {data}")
-                    except socket.timeout:
-                        data = b''
-
-                if data:
-                    flows = []
-                    # Try to parse 16-bit samples (800 bytes = 400 samples)
-                    if len(data) >= 2:
-                        try:
-                            # Parse as 16-bit unsigned integers (little-endian)
-                            import struct
-                            num_samples = len(data) // 2
-                            raw_vals = list(struct.unpack(f'<{num_samples}H', data[:num_samples*2]))
-                            # Interpret raw samples as cumulative or monotonic sensor
-                            # readings mapped linearly: raw 0 -> 0 mL, raw 1200 -> 1000 mL
-                            # Compute instantaneous flow (mL/s) using the formula
-                            # requested: (previous_raw - current_raw) / dt, then
-                            # convert raw-units/s -> mL/s via raw_per_ml.
-                            raw_zero = 0
-                            raw_per_ml = 1.2  # raw units per mL
-                            dt = float(getattr(self, 'sample_interval', 0.3))
-
-                            flows = []
-                            if not raw_vals:
-                                flows = []
-                            elif len(raw_vals) == 1:
-                                flows = [0.0]
-                            else:
-                                # For first point, append zero flow (no previous sample)
-                                flows = [0.0]
-                                for i in range(1, len(raw_vals)):
-                                    prev_raw = float(raw_vals[i-1])
-                                    curr_raw = float(raw_vals[i])
-                                    # compute raw difference as current minus previous
-                                    diff_raw = curr_raw - prev_raw
-                                    # convert raw difference to mL: diff_raw / raw_per_ml
-                                    diff_ml = diff_raw / raw_per_ml
-                                    # divide by dt to get mL/s
-                                    flow = diff_ml / dt if dt > 0 else 0.0
-                                    # negative flow is not meaningful here; clamp
-                                    if flow < 0:
-                                        flow = 0.0
-                                    flows.append(float(flow))
-                            print(f"[TCP PARSE] Parsed {num_samples} 16-bit samples -> computed {len(flows)} flow samples (example: {flows[:10]}...) ")
-                        except Exception as e:
-                            print(f"[TCP PARSE] 16-bit parse failed: {e}")
-                            flows = []
-                    
-                    # Fallback: try text-based parsing
-                    if not flows:
-                        text = data.decode(errors='ignore').strip()
-                        # try JSON first
-                        try:
-                            obj = json.loads(text)
-                            if isinstance(obj, list):
-                                flows = [float(x) for x in obj]
-                            elif isinstance(obj, dict):
-                                # try common keys
-                                for k in ('samples', 'flow_rates', 'flows', 'data'):
-                                    if k in obj and isinstance(obj[k], list):
-                                        flows = [float(x) for x in obj[k]]
-                                        break
-                                if not flows:
-                                    # single value
-                                    for k in ('flow_rate', 'flow', 'value'):
-                                        if k in obj:
-                                            flows = [float(obj[k])]
-                                            break
-                        except Exception:
-                            # fallback: extract numeric substrings (handles formats
-                            # like Python set repr '{5, 7, 8, ...}' as well as CSV/newlines)
-                            nums = re.findall(r'[-+]?\d*\.\d+(?:[eE][-+]?\d+)?|[-+]?\d+', text)
-                        for p in nums:
-                            try:
-                                flows.append(float(p))
-                            except Exception:
-                                continue
-
-                    if flows:
-                        # Clamp flows to configured bounds, map into samples spaced by
-                        # sample_interval (0.3s), and trim to fit graph_total_duration.
-                        clamped = []
-                        for v in flows:
-                            try:
-                                fv = float(v)
-                            except Exception:
-                                continue
-                            fv = max(self.flowrate_min, min(self.flowrate_max, fv))
-                            clamped.append(fv)
-
-                        n = len(clamped)
-                        if n == 0:
-                            samples = []
-                        elif n == 1:
-                            # Single sample recorded at first sample interval
-                            samples = [(float(self.sample_interval), float(clamped[0]))]
-                        else:
-                            # Timestamp samples at 1*dt, 2*dt, ..., n*dt so that
-                            # 15 samples at 0.3s interval end at 4.5s (15*0.3)
-                            samples = [((i + 1) * self.sample_interval, float(clamped[i])) for i in range(n)]
-
-                        # Trim to fit total duration
-                        # maximum number of samples that fit in the total duration
-                        max_samples = max(1, int(self.graph_total_duration / self.sample_interval))
-                        if len(samples) > max_samples:
-                            # keep the most recent samples to show the tail within duration
-                            samples = samples[-max_samples:]
-
-                        self.live_samples = samples
-                        try:
-                            self.plot_live_samples()
-                        except Exception:
-                            pass
-
-                if hasattr(self, 'connect_btn'):
-                    self.connect_btn.config(text='Device Connected')
-                if hasattr(self, 'device_status'):
-                    self.device_status.config(text='Device: Connected')
-            except Exception as e:
-                messagebox.showerror('Connection Error', f'Failed to fetch data: {e}')
-                # ensure UI reflects disconnected state
-                self.device_connected = False
-                if hasattr(self, 'connect_btn'):
-                    self.connect_btn.config(text='Connect Device')
-                if hasattr(self, 'device_status'):
-                    self.device_status.config(text='Device: Disconnected')
+            from acquisition import DEVICE_HOST, DEVICE_PORT, AcquisitionEngine, MODE_BATCH, MODE_STREAM
+            from replay import SessionRecorder
+            if self._last_test_failed:
+                instrumentation.count('reconnects')
+            # a previous test may still be winding down (replay started or
+            # Cancel/Connect within one poll): close its sinks first
+            previous = self.acq_engine
+            if previous is not None:
+                previous.cancel()
+                self._finish_test(previous)
+            # For this build we perform a single-shot fetch of data from the
+            # device on the acquisition thread and render the plot for that
+            # batch only. Results come back through `self.acq_queue`.
+            self.acq_queue = queue.Queue()
+            stream = bool(self.stream_var.get()) if hasattr(self, 'stream_var') else self.stream_mode
+            self.live_samples.clear()
+            self._reset_running_stats()
+            self.redraw.mark_dirty()
+            mode = MODE_STREAM if stream else MODE_BATCH
+            # a replay decodes as it was recorded (older recordings: as now)
+            raw_filter, calibration = self.raw_filter, None
+            if replay is not None:
+                if replay.raw_filter is not None:
+                    raw_filter = replay.raw_filter
+                calibration = replay.calibration
+            if calibration is None:
+                calibration = self._device_calibration(DEVICE_HOST)
+            # recordings and stored sessions are for device tests only; a
+            # replay never writes into them
+            if self.record_sessions and replay is None:
+                name = datetime.now().strftime('%Y-%m-%d_%H_%M_%S') + '.cap'
+                self.session_recorder = SessionRecorder(
+                    os.path.join(self.session_dir, name), mode=mode,
+                    framed=self.framed_protocol, sample_interval=self.sample_interval,
+                    host=DEVICE_HOST, port=DEVICE_PORT, raw_filter=raw_filter,
+                    calibration=calibration.to_dict())
+            self.acq_engine = AcquisitionEngine(
+                self.acq_queue,
+                sample_interval=self.sample_interval,
+                flowrate_min=self.flowrate_min,
+                flowrate_max=self.flowrate_max,
+                graph_total_duration=self.graph_total_duration,
+                on_payload=functools.partial(self._on_device_payload,
+                                             recorder=self.session_recorder),
+                mode=mode,
+                framed=self.framed_protocol,
+                replay=replay,
+                replay_speed=replay_speed,
+                raw_filter=raw_filter,
+                calibration=calibration,
+            )
+            if self.store_sessions and replay is None:
+                self.session_writer = self._open_store().begin(
+                    self.acq_engine.host,
+                    sample_interval=self.sample_interval, mode=self.acq_engine.mode,
+                    framed=self.framed_protocol, raw_filter=raw_filter,
+                    calibration=calibration.to_dict())
+            self.acq_engine.start()
+            if hasattr(self, 'connect_btn'):
+                self.connect_btn.config(text='Cancel Test')
+            if hasattr(self, 'device_status'):
+                self.device_status.config(text='Device: Connecting...')
+            self.root.after(self.acq_poll_ms, self._drain_acquisition, self.acq_engine)
         else:
-            # user toggled to disconnect — clear samples and update UI
-            self.live_samples = []
-            try:
-                self.plot_live_samples()
-            except Exception:
-                pass
+            # user toggled to disconnect — stop any running test, clear
+            # samples and update UI
+            engine = getattr(self, 'acq_engine', None)
+            if engine is not None:
+                engine.cancel()
+                # no more samples are stored once cancelled: close the stored
+                # session with its metrics before they are reset
+                self._close_stored_session(engine)
+            self.live_samples.clear()
+            self._reset_running_stats()
+            self.redraw.mark_dirty()
+            self._set_disconnected_ui()
+
+    def _reset_running_stats(self):
+        if self.metrics is not None:
+            self.metrics.reset()
+        if hasattr(self, 'stats_label'):
+            self.stats_label.config(text='')
+
+    def _update_running_stats(self, times, flows):
+        """Fold a chunk of samples into the running metrics and show them."""
+        if not len(times):
+            return
+        from metrics import format_metrics
+        self.metrics.update(times, flows)
+        if hasattr(self, 'stats_label'):
+            self.stats_label.config(text=format_metrics(self.metrics.snapshot()))
+
+    def _set_disconnected_ui(self):
+        self.device_connected = False
+        if hasattr(self, 'connect_btn'):
+            self.connect_btn.config(text='Connect Device')
+        if hasattr(self, 'device_status'):
+            self.device_status.config(text='Device: Disconnected')
+
+    def _drain_acquisition(self, engine):
+        """Apply messages queued by ``engine`` (Tk thread only).
+
+        Each test has its own drain loop; it ends once the test is finished
+        or replaced by a newer one.
+        """
+        if engine is None or engine is not self.acq_engine:
+            return
+        from acquisition import MSG_STATUS, MSG_PROGRESS, MSG_SAMPLES, MSG_CHUNK, MSG_ERROR, MSG_DONE
+        finished = False
+        try:
+            while True:
+                kind, payload = self.acq_queue.get_nowait()
+                if kind == MSG_STATUS:
+                    if self.device_connected and hasattr(self, 'device_status'):
+                        self.device_status.config(text=payload)
+                elif kind == MSG_PROGRESS:
+                    filled, frame_size = payload
+                    if self.device_connected and hasattr(self, 'device_status'):
+                        pct = 100.0 * filled / frame_size if frame_size else 0.0
+                        self.device_status.config(text=f'Device: Receiving {pct:.0f}%')
+                elif kind == MSG_SAMPLES:
+                    if self.device_connected:
+                        self._mark_received(engine)
+                        times, flows = payload
+                        self.live_samples.clear()
+                        self._reset_running_stats()
+                        self.live_samples.extend(times, flows)
+                        self._update_running_stats(times, flows)
+                        self._store_samples(times, flows)
+                        self.redraw.mark_dirty()
+                elif kind == MSG_CHUNK:
+                    if self.device_connected:
+                        self._mark_received(engine)
+                        times, flows = payload
+                        self.live_samples.extend(times, flows)
+                        self._update_running_stats(times, flows)
+                        self._store_samples(times, flows)
+                        self.redraw.mark_dirty()
+                elif kind == MSG_ERROR:
+                    self._last_test_failed = True
+                    messagebox.showerror('Connection Error', f'Failed to fetch data: {payload}')
+                    # ensure UI reflects disconnected state
+                    self._set_disconnected_ui()
+                elif kind == MSG_DONE:
+                    finished = True
+        except queue.Empty:
+            pass
+
+        if not finished:
+            self.root.after(self.acq_poll_ms, self._drain_acquisition, engine)
+            return
+        self._finish_test(engine)
+        print(f"[PLOT] {self.redraw.report()}")
+        if self.device_connected and not engine.cancelled:
+            self._last_test_failed = False
             if hasattr(self, 'connect_btn'):
-                self.connect_btn.config(text='Connect Device')
+                self.connect_btn.config(text='Device Connected')
             if hasattr(self, 'device_status'):
-                self.device_status.config(text='Device: Disconnected')
+                self.device_status.config(text='Device: Connected')
+
+    def _device_calibration(self, device):
+        if self.calibration is None:
+            from calibration import CalibrationStore
+            self.calibration = CalibrationStore(self.calibration_path).get(device)
+        return self.calibration
+
+    def tare_scale(self):
+        """Zero the scale at the latest reading of the running stream."""
+        engine = getattr(self, 'acq_engine', None)
+        if engine is not None and engine.replay is not None:
+            # a replay is not the scale on the stand: never tare or persist it
+            text = 'Device: Tare is not available during a replay'
+        else:
+            raw = engine.tare() if engine is not None and engine.is_running() else None
+            if raw is None:
+                text = 'Device: Tare needs a running stream'
+            else:
+                # keep the new zero for later tests and restarts
+                from calibration import CalibrationStore
+                CalibrationStore(self.calibration_path).put(engine.host, engine.calibration)
+                text = f'Device: Scale tared at raw {raw}'
+        if hasattr(self, 'device_status'):
+            self.device_status.config(text=text)
+
+    def _finish_test(self, engine):
+        """Close the recording, stored session and replay of ``engine``'s test."""
+        if engine is not self.acq_engine:
+            return
+        self._close_stored_session(engine)
+        self.acq_engine = None
+        self.acq_queue = None
+        if self.session_recorder is not None:
+            self.session_recorder.close(timeout=0)
+            self.session_recorder = None
+        if engine.replay is not None:
+            engine.replay.close()
+
+    def _close_stored_session(self, engine):
+        """Close ``engine``'s stored session with the current running metrics."""
+        if self.session_writer is None or engine is not self.acq_engine:
+            return
+        from sessionstore import STATUS_CANCELLED, STATUS_COMPLETE, STATUS_FAILED
+        status = (STATUS_CANCELLED if engine.cancelled else
+                  STATUS_FAILED if engine.failed else STATUS_COMPLETE)
+        self.session_writer.close(status, metrics=self.metrics.snapshot(), timeout=0)
+        self.session_writer = None
+
+    def _open_store(self):
+        if self.session_store is None:
+            from sessionstore import SessionStore
+            self.session_store = SessionStore(self.store_dir)
+            # nothing is writing yet: sessions still 'recording' were cut short
+            interrupted = self.session_store.recover()
+            if interrupted:
+                print(f"[STORE] {interrupted} interrupted session(s) recovered")
+        return self.session_store
+
+    def _store_samples(self, times, flows):
+        if self.session_writer is not None:
+            self.session_writer.append(times, flows)
+
+    def show_session(self, session_id):
+        """Load a stored test onto the live plot (for replot / reporting)."""
+        self._finish_startup()
+        times, flows, row = self._open_store().load(session_id)
+        self.live_samples.clear()
+        self._reset_running_stats()
+        self.live_samples.extend(times, flows)
+        self._update_running_stats(times, flows)
+        self.redraw.mark_dirty()
+        started = datetime.fromtimestamp(row['started']).strftime('%Y-%m-%d %H:%M')
+        if hasattr(self, 'device_status'):
+            self.device_status.config(text=f"Session {session_id} ({row['device']}, {started})")
+
+    def _mark_received(self, engine):
+        # the receive -> plot latency runs from the oldest undrawn payload
+        if instrumentation.enabled and self._plot_received is None:
+            self._plot_received = engine.received_at
 
     # internal TCP server removed — if you need a test server, run
     # `server.py` or re-add a dedicated component to push JSON samples into
     # `app.live_samples` or `app.server_queue` (if re-enabled).
     
     def generate_pdf(self):
-        # Generate a PDF report from the current live samples only (no DB/patient data).
+        """Queue a PDF report of the current live samples (no DB/patient data).
+
+        Rendering runs in a worker process and printing on the print queue;
+        progress comes back through `_on_report_status` so the operator can
+        start the next test while the report renders and prints.
+        """
         if not self.live_samples:
             messagebox.showerror('Error', 'No live samples available to include in PDF')
             return
 
-        # Generate default filename with current date and time (HR_MM format)
-        default_filename = datetime.now().strftime('%Y-%m-%d_%H_%M') + '.pdf'
+        # Generate default filename with current date and time (HR_MM_SS
+        # format) and the report job id, unique even within one second
+        default_filename = datetime.now().strftime('%Y-%m-%d_%H_%M_%S') + '_{job}.pdf'
         default_dir = '/home/prashantk39/work/picow/'
-        
+
         # Ensure directory exists
         os.makedirs(default_dir, exist_ok=True)
-        
+
         # Auto-save to default location
         file_path = os.path.join(default_dir, default_filename)
 
+        if self.report_service is None:
+            from reporting import ReportService
+            self.report_service = ReportService(on_status=self._on_report_status)
+        xs, ys = self.live_samples.view()
+        self.report_service.submit(file_path, xs, ys, metrics=self.metrics.snapshot(),
+                                   **self._report_plot_args())
+        self._reports_open += 1
+        if self._reports_open == 1:
+            self.root.after(self.acq_poll_ms, self._drain_report_events)
+
+    def _report_plot_args(self):
+        return dict(graph_total_duration=float(self.graph_total_duration),
+                    flowrate_min=float(self.flowrate_min),
+                    flowrate_max=float(self.flowrate_max))
+
+    def _on_report_status(self, job_id, status, detail):
+        # called from report/print worker threads: hand over to the Tk thread
+        self.report_events.put((job_id, status, detail))
+
+    def _drain_report_events(self):
+        """Show report/print progress (Tk thread only)."""
+        from reporting import (STATUS_RENDERING, STATUS_RENDERED, STATUS_RENDER_FAILED,
+                               STATUS_PRINTING, STATUS_PRINT_RETRY, STATUS_PRINTED,
+                               STATUS_PRINT_FAILED)
         try:
-            self._generate_pdf_from_live(file_path)
-            messagebox.showinfo('Success', f'PDF Report auto-saved: {file_path}')
-            
-            # Print the PDF using lp command
-            try:
-                subprocess.run(['lp', '-d', 'DCPT220', file_path], check=True, capture_output=True)
-                messagebox.showinfo('Print', f'PDF sent to printer DCPT220')
-            except subprocess.CalledProcessError as pe:
-                messagebox.showwarning('Print Warning', f'Failed to print PDF: {pe}')
-            except Exception as pe:
-                messagebox.showwarning('Print Warning', f'Print command error: {pe}')
-        except Exception as e:
-            messagebox.showerror('Error', f'Failed to generate PDF: {e}')
+            while True:
+                job_id, status, detail = self.report_events.get_nowait()
+                if status == STATUS_RENDER_FAILED:
+                    messagebox.showerror('Error', detail)
+                elif status == STATUS_PRINT_FAILED:
+                    messagebox.showwarning('Print Warning', detail)
+                if status in (STATUS_RENDER_FAILED, STATUS_PRINTED, STATUS_PRINT_FAILED):
+                    self._reports_open -= 1
+                text = {
+                    STATUS_RENDERING: 'Report: rendering...',
+                    STATUS_RENDERED: f'Report saved: {os.path.basename(detail)}',
+                    STATUS_PRINTING: 'Report: printing...',
+                    STATUS_PRINT_RETRY: 'Report: printer busy, retrying',
+                    STATUS_PRINTED: 'Report: sent to printer',
+                }.get(status)
+                if text and hasattr(self, 'report_status'):
+                    self.report_status.config(text=text)
+        except queue.Empty:
+            pass
+        if self._reports_open > 0:
+            self.root.after(self.acq_poll_ms * 5, self._drain_report_events)
+
     def _generate_pdf_from_live(self, file_path):
         """Build a simple PDF containing stats and a graph from live_samples."""
-        samples = list(self.live_samples)
-        if not samples:
+        if not self.live_samples:
             raise ValueError('No live samples')
-
-        xs = [s[0] for s in samples]
-        ys = [s[1] for s in samples]
-
-        # compute simple statistics
-        duration = xs[-1] - xs[0] if len(xs) > 1 else 0.0
-        avg_flow = float(sum(ys) / len(ys)) if ys else 0.0
-        # approximate volume by trapezoidal integration
-        total_vol = 0.0
-        for i in range(len(xs) - 1):
-            dt = xs[i+1] - xs[i]
-            total_vol += 0.5 * (ys[i] + ys[i+1]) * dt
-
-        doc = SimpleDocTemplate(file_path, pagesize=letter)
-        elements = []
-        styles = getSampleStyleSheet()
-
-        title_style = ParagraphStyle('CustomTitle', parent=styles['Heading1'], fontSize=18, textColor='#003366')
-        elements.append(Paragraph('Live Uroflowmetry Report', title_style))
-        elements.append(Spacer(1, 0.2 * inch))
-
-        meta_table = Table([
-            ['Generated:', datetime.now().strftime('%Y-%m-%d %H:%M:%S')],
-            ['Duration (s):', f"{duration:.2f}"],
-            ['Average Flow (mL/s):', f"{avg_flow:.2f}"],
-            ['Estimated Volume (mL):', f"{total_vol:.2f}"]
-        ], colWidths=[2.5*inch, 3.5*inch])
-        meta_table.setStyle(TableStyle([('GRID', (0,0), (-1,-1), 0.5, '#444444')]))
-        elements.append(meta_table)
-        elements.append(Spacer(1, 0.2 * inch))
-
-        # create plot image from samples
-        fig = Figure(figsize=(6, 3), dpi=100)
-        ax = fig.add_subplot(111)
-        ax.plot(xs, ys, color='#2a9df4', linewidth=1.5)
-        ax.fill_between(xs, ys, alpha=0.15, color='#2a9df4')
-        ax.set_xlabel('Time (s)')
-        ax.set_ylabel('Flow Rate (mL/s)')
-        ax.set_title('Live Flow (stream)')
-        ax.grid(True, alpha=0.3)
-        try:
-            ax.set_xlim(0.0, float(self.graph_total_duration))
-        except Exception:
-            pass
-        try:
-            ax.set_ylim(float(self.flowrate_min), float(self.flowrate_max))
-        except Exception:
-            pass
-
-        tmpf = tempfile.NamedTemporaryFile(suffix='.png', delete=False)
-        tmpf.close()
-        canvas = FigureCanvasAgg(fig)
-        canvas.print_png(tmpf.name)
-
-        elements.append(Image(tmpf.name, width=6 * inch))
-
-        doc.build(elements)
-
-        try:
-            os.remove(tmpf.name)
-        except Exception:
-            pass
+        from reporting import build_report
+        xs, ys = self.live_samples.view()
+        build_report(file_path, xs, ys, metrics=self.metrics.snapshot(), **self._report_plot_args())
 
 if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='Uroflowmetry System')
+    parser.add_argument('--replay', help='replay a recorded session (.cap) instead of the device')
+    parser.add_argument('--speed', type=float, default=1.0, help='replay speed, 0 = maximum')
+    parser.add_argument('--metrics-port', type=int, default=0,
+                        help='serve counters/latencies on this local HTTP port (0 = off)')
+    parser.add_argument('--overlay', action='store_true', help='show the instrumentation overlay')
+    parser.add_argument('--session', type=int, help='show a stored session (see sessionstore.py list)')
+    args = parser.parse_args()
+    if args.metrics_port:
+        instrumentation.MetricsServer(port=args.metrics_port).start()
     root = tk.Tk()
     app = UroflowmetryApp(root)
+    if args.overlay:
+        app.toggle_overlay()
+    if args.replay:
+        root.after(500, lambda: app.replay_session(args.replay, args.speed))
+    elif args.session is not None:
+        root.after(500, lambda: app.show_session(args.session))
     root.mainloop()
+    app.tcp_capture.close()
+    if app.report_service is not None:
+        app.report_service.shutdown()